@@ -18,6 +18,8 @@
 
 # OUTPUT:
 # 1. Individual annotated plots for each profile (saved in the input-directory/plots/ directory)
+# - Plots newer than their .txt file and drawn by this same script are kept on
+#   re-runs (set AFM_FORCE=1 to redraw all)
 # - Color-coded markers (red=global max, blue=global min, orange=local max)
 # - Visual amplitude annotations
 # 2. CSV file with per-file results and summary statistics
@@ -32,14 +34,93 @@
 
 import os
 import re
-import glob
 import csv
+import hashlib
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # plots are only saved to disk; no GUI in the worker processes
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+# Output resolution of the saved PNGs (diagnostic plots, 150 dpi is plenty)
+DPI = 150
+# Fast zlib level for the PNG encoder: slightly larger files, much faster saves
+PNG_SAVE_KW = {'pil_kwargs': {'compress_level': 1}}
+
+# Re-runs skip profile plots that are newer than their input file;
+# set AFM_FORCE=1 in the environment to redraw everything
+FORCE_REPLOT = os.environ.get("AFM_FORCE", "0") == "1"
+
+# Stamp saved in every profile PNG: a plot is only reused if this exact script
+# drew it (v2/v3 write the same file names, and any code, style or DPI change
+# alters the hash)
+with open(__file__, "rb") as _f:
+    PLOT_STAMP = f"{os.path.basename(__file__)} {hashlib.sha1(_f.read()).hexdigest()[:12]}"
+
+# Precompiled patterns (number token for the fallback parser, unsafe filename characters)
+_NUM_RE = re.compile(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?")
+_STEM_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def _is_data_line(s: str):
+
+    parts = s.split()
+    if len(parts) < 2:
+        return False
+    try:
+        float(parts[0])
+        float(parts[1])
+    except ValueError:
+        return False
+    return True
+
+
+def _count_header_rows(path: str):
+
+    # Number of lines before the first "x z" numeric line (Gwyddion header, units, ...)
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for i, line in enumerate(f):
+            if _is_data_line(line):
+                return i
+    return None
+
+
+def _sort_by_x(x: np.ndarray, z: np.ndarray):
+
+    # Gwyddion exports are monotone in x: only sort when they are not
+    d = np.diff(x)
+    if (d >= 0).all():
+        return x, z
+    if (d <= 0).all():
+        return x[::-1], z[::-1]  # reversed views, no copy
+
+    order = np.argsort(x, kind="stable")
+    return x[order], z[order]
 
 
 def load_profile_txt(path: str):
-    
+
+    header_rows = _count_header_rows(path)
+
+    # Fast path: parse the whole numeric block in C. Only whitespace-separated
+    # columns are detected here; other layouts (e.g. "1.0,2.0") go to the
+    # regex parser below
+    data = None
+    if header_rows is not None:
+        try:
+            data = np.loadtxt(path, comments=("#", ";"), skiprows=header_rows,
+                              usecols=(0, 1), dtype=np.float64, ndmin=2,
+                              encoding="utf-8")
+        except ValueError:
+            data = None
+
+    if data is not None:
+        if data.shape[0] < 3:
+            raise ValueError("Not enough numeric data lines found.")
+        return _sort_by_x(data[:, 0], data[:, 1])
+
+    # Slow path: irregular lines (stray text, gwyddion lines mixed in the data)
     xs, zs = [], []
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
         for line in f:
@@ -49,7 +130,7 @@ def load_profile_txt(path: str):
             if s.startswith("#") or s.startswith(";") or s.lower().startswith("gwyddion"):
                 continue
 
-            nums = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", s)
+            nums = _NUM_RE.findall(s)
             if len(nums) >= 2:
                 xs.append(float(nums[0]))
                 zs.append(float(nums[1]))
@@ -57,83 +138,80 @@ def load_profile_txt(path: str):
     if len(xs) < 3:
         raise ValueError("Not enough numeric data lines found.")
 
-    x = np.array(xs)
-    z = np.array(zs)
+    x = np.fromiter(xs, dtype=np.float64, count=len(xs))
+    z = np.fromiter(zs, dtype=np.float64, count=len(zs))
 
-    # sort by x just in case
-    order = np.argsort(x)
-    #print(x[order])
-    #print(z[order])
-    return x[order], z[order]
+    return _sort_by_x(x, z)
 
 
-def vertical_amplitude_ptp(z: np.ndarray):
-    
-    return abs(float(np.max(z) - np.min(z)))
+def profile_extrema(z: np.ndarray):
 
+    # Global extrema and the local maxima around the global minimum, computed once
+    # and shared by the V/H metrics and the plot
+    i_min = int(np.argmin(z))
+    i_max = int(np.argmax(z))
 
-def horizontal_amplitude_around_min(x: np.ndarray, y: np.ndarray):
-    
-    # Find global minimum
-    i_min = int(np.argmin(y))
-    #print(i_min)
-
-    # Find local maximum on the left side (use closest to i_min if there are ties)
-    if i_min > 0:
-        left_section = y[: i_min + 1]
-        max_val_left = np.max(left_section)
-        # Find all indices with this maximum value
-        candidates_left = np.where(left_section == max_val_left)[0]
-        # Pick the rightmost (closest to i_min)
-        i_left = int(candidates_left[-1])
-    else:
-        i_left = 0
-
-    # Find local maximum on the right side (use closest to i_min if there are ties)
-    if i_min < len(y) - 1:
-        right_section = y[i_min:]
-        max_val_right = np.max(right_section)
-        # Find all indices with this maximum value (relative to right_section)
-        candidates_right = np.where(right_section == max_val_right)[0]
-        # Pick the leftmost (closest to i_min), then offset by i_min
-        i_right = int(i_min + candidates_right[0])
-    else:
-        i_right = len(y) - 1
+    # Local maximum on the left side, closest to i_min if there are ties:
+    # argmax returns the first occurrence, so scanning the reversed view
+    # gives the rightmost maximum without building a boolean mask
+    i_left = i_min - int(np.argmax(z[i_min::-1]))
+
+    # Local maximum on the right side, closest to i_min if there are ties
+    # (first occurrence = leftmost), offset by i_min
+    i_right = i_min + int(np.argmax(z[i_min:]))
+
+    # Peak-to-peak from the indices already found (no extra pass over z)
+    v_amp = abs(float(z[i_max] - z[i_min]))
+
+    return i_min, i_max, i_left, i_right, v_amp
+
+
+def horizontal_amplitude_around_min(x: np.ndarray, extrema):
 
+    i_min, i_max, i_left, i_right, v_amp = extrema
     width = float(abs(x[i_right] - x[i_left]))
     return width, (i_left, i_min, i_right)
 
 
 def mean_sd(values):
     
-    v = np.array(values, dtype=float)
+    v = np.asarray(values, dtype=float)
     v = v[np.isfinite(v)]
     if v.size == 0:
         return float("nan"), float("nan"), 0
     
     mean = float(np.mean(v))
-    sd = float(np.std(v, ddof=1)) if v.size > 1 else 0.0
+    if v.size > 1:
+        # Sample SD from one centered array; the dot product fuses square + sum
+        # (np.std builds extra temporaries for the same result)
+        d = v - mean
+        sd = float(np.sqrt(np.dot(d, d) / (v.size - 1)))
+    else:
+        sd = 0.0
 
     return mean, sd, int(v.size)
 
 
-def plot_histogram(values, stats, metric_name, color, output_path):
+def plot_histogram(fig, ax, values, stats, metric_name, color, output_path):
     
     # Filter out NaN values
-    finite_vals = np.array([v for v in values if np.isfinite(v)])
+    arr = np.asarray(values, dtype=float)
+    finite_vals = arr[np.isfinite(arr)]
     
     if len(finite_vals) == 0:
         print(f"  Warning: No finite values for {metric_name}")
         return None
     
-    # Create figure
-    fig, ax = plt.subplots(figsize=(10, 6))
+    # Reuse the caller's figure
+    ax.clear()
     
     # Use 'auto' binning, but ensure at least 5 bins if we have enough data
     n_bins = 'auto' if len(finite_vals) > 10 else max(5, len(finite_vals) // 2)
     
-    n, bins, patches = ax.hist(finite_vals, bins=n_bins, color=color, 
-                                edgecolor='black', alpha=0.7, linewidth=1.2)
+    # Bin once with NumPy and draw the bars directly
+    counts, edges = np.histogram(finite_vals, bins=n_bins)
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', color=color,
+           edgecolor='black', alpha=0.7, linewidth=1.2)
     
     # Add mean line
     ax.axvline(stats['mean'], color='red', linestyle='--', linewidth=2.5, 
@@ -154,9 +232,8 @@ def plot_histogram(values, stats, metric_name, color, output_path):
     ax.legend(loc='best', fontsize=10, framealpha=0.95)
     ax.grid(True, alpha=0.3, linestyle=':', linewidth=0.5)
     
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    plt.close(fig)
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=DPI, bbox_inches='tight', **PNG_SAVE_KW)
     
     return output_path
 
@@ -164,45 +241,78 @@ def plot_histogram(values, stats, metric_name, color, output_path):
 def safe_stem(filename: str):
     
     stem = os.path.splitext(filename)[0]
-    return re.sub(r"[^A-Za-z0-9._-]+", "_", stem)
+    return _STEM_RE.sub("_", stem)
+
+
+# Static styling for plot_profile (built once, matplotlib copies these on use)
+_MAX_SCATTER_KW = dict(s=120, c='red', marker='o', edgecolors='darkred',
+                       linewidths=2, label='Global Max', zorder=5)
+_MIN_SCATTER_KW = dict(s=120, c='blue', marker='o', edgecolors='darkblue',
+                       linewidths=2, label='Global Min', zorder=5)
+_LOCAL_SCATTER_KW = dict(s=80, c='orange', marker='s', edgecolors='darkorange',
+                         linewidths=1.5, label='Local Max (H metric)', zorder=4)
+_V_ARROW_KW = dict(arrowstyle="<->", lw=2, color='purple')
+_V_BBOX_KW = dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='purple', alpha=0.8)
+_H_ARROW_KW = dict(arrowstyle="<->", lw=2, color='green')
+_H_BBOX_KW = dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='green', alpha=0.8)
+
+# One Figure per process, cleared and reused for every profile
+_PROFILE_FIG = None
+
+
+def _profile_figure():
+
+    global _PROFILE_FIG
+    if _PROFILE_FIG is None:
+        _PROFILE_FIG = plt.subplots(figsize=(10, 6))
+    return _PROFILE_FIG
+
 
+def _plot_is_current(out_path: str, path: str):
 
-def plot_profile(path: str, x: np.ndarray, z: np.ndarray, out_dir: str, idxs):
+    if not os.path.exists(out_path) or os.path.getmtime(out_path) <= os.path.getmtime(path):
+        return False
+    try:
+        with Image.open(out_path) as im:
+            return im.text.get("AFM-Plot-Stamp") == PLOT_STAMP
+    except OSError:
+        return False
+
+
+def plot_profile(fig, ax, path: str, x: np.ndarray, z: np.ndarray, out_dir: str,
+                 i_left, i_min, i_right, i_max, v_amp, h_amp):
     
     name = os.path.basename(path)
     stem = safe_stem(name)
 
-    i_left, i_min, i_right = idxs
-
-    # Global extrema
-    i_max = int(np.argmax(z))
-    i_min_global = int(np.argmin(z))
+    # Incremental re-run: keep the existing plot if it is up to date
+    # (returns the path and whether the plot was drawn)
+    out_path = os.path.join(out_dir, f"{stem}_profile.png")
+    if not FORCE_REPLOT and _plot_is_current(out_path, path):
+        return out_path, False
 
+    # Indices and metrics come from profile_extrema (x is sorted by load_profile_txt)
     x_max, z_max = float(x[i_max]), float(z[i_max])
-    x_min, z_min = float(x[i_min_global]), float(z[i_min_global])
-
-    v_amp = z_max - z_min
-    h_amp = float(abs(x[i_right] - x[i_left]))
+    x_min, z_min = float(x[i_min]), float(z[i_min])
+    x_lo, x_hi = float(x[0]), float(x[-1])
 
     # Calculate plot ranges
-    x_span = float(np.max(x) - np.min(x))
-    z_span = float(np.max(z) - np.min(z))
+    x_span = x_hi - x_lo
+    z_span = z_max - z_min
     if x_span == 0:
         x_span = 1.0
     if z_span == 0:
         z_span = 1.0
 
-    # Create figure
-    fig, ax = plt.subplots(figsize=(10, 6))
+    # Reuse the caller's figure
+    ax.clear()
     
     # Plot the profile
-    ax.plot(x, z, 'k-', linewidth=1.5, label='Profile', zorder=1)
+    ax.plot(x, z, 'k-', linewidth=1.5, label='Profile', zorder=1, rasterized=True)
 
     # Mark GLOBAL extrema with larger markers
-    ax.scatter([x_max], [z_max], s=120, c='red', marker='o', 
-               edgecolors='darkred', linewidths=2, label='Global Max', zorder=5)
-    ax.scatter([x_min], [z_min], s=120, c='blue', marker='o', 
-               edgecolors='darkblue', linewidths=2, label='Global Min', zorder=5)
+    ax.scatter([x_max], [z_max], **_MAX_SCATTER_KW)
+    ax.scatter([x_min], [z_min], **_MIN_SCATTER_KW)
 
     # Mark LOCAL maxima (used for horizontal metric) with smaller, different color
     # Only plot them if they're different from global max
@@ -217,16 +327,15 @@ def plot_profile(path: str, x: np.ndarray, z: np.ndarray, out_dir: str, idxs):
         local_markers_z.append(z[i_right])
     
     if local_markers_x:
-        ax.scatter(local_markers_x, local_markers_z, s=80, c='orange', marker='s',
-                   edgecolors='darkorange', linewidths=1.5, label='Local Max (H metric)', zorder=4)
+        ax.scatter(local_markers_x, local_markers_z, **_LOCAL_SCATTER_KW)
 
     # --- Vertical amplitude annotation (global max-min) ---
-    x_bracket = float(np.max(x) + 0.10 * x_span)
+    x_bracket = float(x_hi + 0.10 * x_span)
     ax.annotate(
         "",
         xy=(x_bracket, z_max),
         xytext=(x_bracket, z_min),
-        arrowprops=dict(arrowstyle="<->", lw=2, color='purple'),
+        arrowprops=_V_ARROW_KW,
         annotation_clip=False,
     )
     ax.text(
@@ -238,16 +347,16 @@ def plot_profile(path: str, x: np.ndarray, z: np.ndarray, out_dir: str, idxs):
         fontsize=11,
         fontweight="bold",
         color='purple',
-        bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='purple', alpha=0.8)
+        bbox=_V_BBOX_KW
     )
 
     # --- Horizontal amplitude annotation (between local maxima) ---
-    y_arrow = float(np.min(z) - 0.14 * z_span)
+    y_arrow = float(z_min - 0.14 * z_span)
     ax.annotate(
         "",
         xy=(x[i_left], y_arrow),
         xytext=(x[i_right], y_arrow),
-        arrowprops=dict(arrowstyle="<->", lw=2, color='green'),
+        arrowprops=_H_ARROW_KW,
         annotation_clip=False,
     )
     ax.text(
@@ -259,7 +368,7 @@ def plot_profile(path: str, x: np.ndarray, z: np.ndarray, out_dir: str, idxs):
         fontsize=11,
         fontweight="bold",
         color='green',
-        bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='green', alpha=0.8)
+        bbox=_H_BBOX_KW
     )
 
     # Dashed guide lines for horizontal metric
@@ -280,45 +389,64 @@ def plot_profile(path: str, x: np.ndarray, z: np.ndarray, out_dir: str, idxs):
     ax.grid(True, alpha=0.3, linestyle=':', linewidth=0.5)
 
     # Expand limits to keep annotations visible
-    ax.set_xlim(float(np.min(x) - 0.02 * x_span), float(x_bracket + 0.12 * x_span))
-    ax.set_ylim(float(y_arrow - 0.10 * z_span), float(np.max(z) + 0.10 * z_span))
+    ax.set_xlim(float(x_lo - 0.02 * x_span), float(x_bracket + 0.12 * x_span))
+    ax.set_ylim(float(y_arrow - 0.10 * z_span), float(z_max + 0.10 * z_span))
 
-    plt.tight_layout()
+    fig.tight_layout()
 
-    out_path = os.path.join(out_dir, f"{stem}_profile.png")
-    plt.savefig(out_path, dpi=300, bbox_inches='tight')
-    plt.close(fig)
+    fig.savefig(out_path, dpi=DPI, bbox_inches='tight',
+                metadata={"AFM-Plot-Stamp": PLOT_STAMP}, **PNG_SAVE_KW)
 
-    return v_amp, h_amp, out_path
+    return out_path, True
 
 
-def save_results_to_csv(per_file_results, summary_stats, output_path):
-    
-    with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        
-        # Write header
-        writer.writerow(['=== PER-FILE RESULTS ==='])
-        writer.writerow(['Filename', 'Vertical_Amplitude_ptp', 'Horizontal_Amplitude_around_min'])
-        
-        # Write per-file data
-        for name, v, h in per_file_results:
-            v_str = f"{v:.10g}" if np.isfinite(v) else "NaN"
-            h_str = f"{h:.10g}" if np.isfinite(h) else "NaN"
-            writer.writerow([name, v_str, h_str])
-        
-        # Write summary
-        writer.writerow([])
-        writer.writerow(['=== SUMMARY STATISTICS ==='])
-        writer.writerow(['Metric', 'Mean', 'SD', 'N'])
-        writer.writerow(['Vertical_Amplitude_ptp', 
-                        f"{summary_stats['v_mean']:.10g}", 
-                        f"{summary_stats['v_sd']:.10g}", 
-                        summary_stats['v_n']])
-        writer.writerow(['Horizontal_Amplitude_around_min', 
-                        f"{summary_stats['h_mean']:.10g}", 
-                        f"{summary_stats['h_sd']:.10g}", 
-                        summary_stats['h_n']])
+def _csv_number(val):
+
+    return f"{val:.10g}" if np.isfinite(val) else "NaN"
+
+
+def write_csv_header(writer):
+
+    writer.writerow(['=== PER-FILE RESULTS ==='])
+    writer.writerow(['Filename', 'Vertical_Amplitude_ptp', 'Horizontal_Amplitude_around_min'])
+
+
+def write_csv_row(writer, name, v, h):
+
+    writer.writerow([name, _csv_number(v), _csv_number(h)])
+
+
+def write_csv_summary(writer, summary_stats):
+
+    writer.writerow([])
+    writer.writerow(['=== SUMMARY STATISTICS ==='])
+    writer.writerow(['Metric', 'Mean', 'SD', 'N'])
+    writer.writerow(['Vertical_Amplitude_ptp', 
+                    f"{summary_stats['v_mean']:.10g}", 
+                    f"{summary_stats['v_sd']:.10g}", 
+                    summary_stats['v_n']])
+    writer.writerow(['Horizontal_Amplitude_around_min', 
+                    f"{summary_stats['h_mean']:.10g}", 
+                    f"{summary_stats['h_sd']:.10g}", 
+                    summary_stats['h_n']])
+
+
+def process_one_file(path: str, plots_dir: str):
+
+    # Full pipeline for one profile (top-level so it can run in a worker process)
+    name = os.path.basename(path)
+    x, z = load_profile_txt(path)
+
+    extrema = profile_extrema(z)
+    i_min, i_max, i_left, i_right, v = extrema
+    h_width, idxs = horizontal_amplitude_around_min(x, extrema)
+
+    # Save annotated plot (reuses the metrics computed above)
+    fig, ax = _profile_figure()
+    out_plot, drawn = plot_profile(fig, ax, path, x, z, plots_dir,
+                                   i_left, i_min, i_right, i_max, v, h_width)
+
+    return name, v, h_width, out_plot, drawn
 
 
 def main():
@@ -337,7 +465,9 @@ def main():
         print(f"\nERROR: Not a folder: {folder}")
         return
 
-    files = sorted(glob.glob(os.path.join(folder, "*.txt")))
+    # One directory scan (file type comes from the cached dir entry, no extra stat)
+    files = sorted(e.path for e in os.scandir(folder)
+                   if e.is_file() and e.name.lower().endswith(".txt"))
     if not files:
         print(f"\nNo .txt files found in: {folder}")
         return
@@ -345,35 +475,49 @@ def main():
     plots_dir = os.path.join(folder, "plots")
     os.makedirs(plots_dir, exist_ok=True)
 
-    per_file = []
-    vamps = []
-    hamps = []
-    plot_paths = []
+    names = [os.path.basename(path) for path in files]
+    vamps = np.full(len(files), np.nan)
+    hamps = np.full(len(files), np.nan)
+    n_plots = 0
 
     print(f"\nFound {len(files)} .txt file(s). Processing...\n")
 
-    for i, path in enumerate(files, 1):
-        name = os.path.basename(path)
-        print(f"  [{i}/{len(files)}] Processing: {name}...", end=" ")
-        try:
-            x, z = load_profile_txt(path)
-
-            v = vertical_amplitude_ptp(z)
-            h_width, idxs = horizontal_amplitude_around_min(x, z)
-
-            # Save annotated plot
-            v2, h2, out_plot = plot_profile(path, x, z, plots_dir, idxs)
-
-            per_file.append((name, v, h_width))
-            vamps.append(v)
-            hamps.append(h_width)
-            plot_paths.append(out_plot)
-            
-            print("✓")
-
-        except Exception as e:
-            per_file.append((name, np.nan, np.nan))
-            print(f"✗ ERROR: {e}")
+    # Per-file rows are written to the CSV as soon as each result is available,
+    # the summary is appended once all files are done
+    csv_path = os.path.join(folder, "afm_analysis_results.csv")
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        write_csv_header(writer)
+
+        # Files are independent: process them in parallel, results are collected in file order
+        n_workers = min(len(files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(process_one_file, path, plots_dir) for path in files]
+
+            for i, future in enumerate(futures, 1):
+                name = names[i - 1]
+                try:
+                    name, v, h_width, out_plot, drawn = future.result()
+                    n_plots += drawn
+                    print(f"  [{i}/{len(files)}] {name} ✓")
+
+                except Exception as e:
+                    v, h_width = np.nan, np.nan
+                    print(f"  [{i}/{len(files)}] {name} ✗ ERROR: {e}")
+
+                vamps[i - 1] = v
+                hamps[i - 1] = h_width
+                write_csv_row(writer, name, v, h_width)
+
+        # Summary stats, appended to the CSV once all files are done
+        v_mean, v_sd, v_n = mean_sd(vamps)
+        h_mean, h_sd, h_n = mean_sd(hamps)
+
+        summary = {
+            'v_mean': v_mean, 'v_sd': v_sd, 'v_n': v_n,
+            'h_mean': h_mean, 'h_sd': h_sd, 'h_n': h_n
+        }
+        write_csv_summary(writer, summary)
 
     # Print per-file results
     print("\n" + "=" * 78)
@@ -381,20 +525,11 @@ def main():
     print("=" * 78)
     print(f"{'Filename':40s}  {'V_amp (ptp)':>16s}  {'H_amp (local max)':>18s}")
     print("-" * 78)
-    for name, v, h in per_file:
+    for name, v, h in zip(names, vamps, hamps):
         v_str = f"{v:.6g}" if np.isfinite(v) else "NaN"
         h_str = f"{h:.6g}" if np.isfinite(h) else "NaN"
         print(f"{name[:40]:40s}  {v_str:>16s}  {h_str:>18s}")
 
-    # Summary stats
-    v_mean, v_sd, v_n = mean_sd(vamps)
-    h_mean, h_sd, h_n = mean_sd(hamps)
-
-    summary = {
-        'v_mean': v_mean, 'v_sd': v_sd, 'v_n': v_n,
-        'h_mean': h_mean, 'h_sd': h_sd, 'h_n': h_n
-    }
-
     print("\n" + "=" * 78)
     print("SUMMARY STATISTICS (finite values only):")
     print("=" * 78)
@@ -411,20 +546,18 @@ def main():
     v_hist_path = os.path.join(folder, "vertical_amplitude_distribution.png")
     h_hist_path = os.path.join(folder, "horizontal_amplitude_distribution.png")
     
-    v_hist_saved = plot_histogram(vamps, v_stats, 'Vertical Amplitude (ptp)', 
+    fig, ax = plt.subplots(figsize=(10, 6))
+    v_hist_saved = plot_histogram(fig, ax, vamps, v_stats, 'Vertical Amplitude (ptp)', 
                                    'steelblue', v_hist_path)
-    h_hist_saved = plot_histogram(hamps, h_stats, 'Horizontal Amplitude (local max)', 
+    h_hist_saved = plot_histogram(fig, ax, hamps, h_stats, 'Horizontal Amplitude (local max)', 
                                    'seagreen', h_hist_path)
+    plt.close(fig)
 
-    # Save results to CSV
-    csv_path = os.path.join(folder, "afm_analysis_results.csv")
-    save_results_to_csv(per_file, summary, csv_path)
-    
     print("\n" + "=" * 78)
     print("OUTPUT FILES:")
     print("=" * 78)
     print(f"  • Individual plots: {plots_dir}/")
-    print(f"    ({len(plot_paths)} profile plot(s) created)")
+    print(f"    ({n_plots} profile plot(s) created)")
     print(f"  • Distribution histograms:")
     if v_hist_saved:
         print(f"    - Vertical: {v_hist_path}")
@@ -19,7 +19,8 @@
 #    - Tie-breaking: When multiple points share the max value (plateaus),
 #      selects the point closest to the minimum to avoid overestimation
 # 6. Width (W):
-#    - Builds a cubic spline through the profile data
+#    - Builds a cubic spline through the profile data (or a monotone PCHIP
+#      interpolant, see SPLINE_KIND)
 #    - Identifies the smaller of the two local maxima
 #    - Finds where the spline crosses z = z_ref on the opposite side of
 #      the global minimum (z_ref = smaller max's z-value)
@@ -58,77 +59,149 @@ import re
 import glob
 import csv
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # plots are only saved to disk; no GUI in the worker processes
+# Batch rendering: let Agg drop near-collinear vertices of the long profile line
+matplotlib.rcParams['path.simplify'] = True
+matplotlib.rcParams['path.simplify_threshold'] = 1.0
+matplotlib.rcParams['agg.path.chunksize'] = 10000
 import matplotlib.pyplot as plt
-from scipy.interpolate import CubicSpline
+from matplotlib import patheffects as pe
+from scipy.interpolate import CubicSpline, PchipInterpolator
+from concurrent.futures import ProcessPoolExecutor
+
+# Output resolution of the saved PNGs (diagnostic plots, 150 dpi is plenty)
+DPI = 150
+# Fast zlib level for the PNG encoder: slightly larger files, much faster saves
+PNG_SAVE_KW = {'pil_kwargs': {'compress_level': 1}}
+
+# Interpolant behind the width metric and the smooth plot curve:
+#   'cubic' - not-a-knot cubic spline (banded solve, original behaviour)
+#   'pchip' - monotone cubic Hermite (local slopes, no solve, never overshoots the data)
+SPLINE_KIND = 'cubic'
+
+
+def _is_data_line(s: str):
+
+    parts = s.split()
+    if len(parts) < 2:
+        return False
+    try:
+        float(parts[0])
+        float(parts[1])
+    except ValueError:
+        return False
+    return True
+
+
+def _count_header_rows(path: str):
+
+    # Number of lines before the first "x z" numeric line (Gwyddion header, units, ...)
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for i, line in enumerate(f):
+            if _is_data_line(line):
+                return i
+    return None
+
+
+def _sort_by_x(x: np.ndarray, z: np.ndarray):
+
+    # Gwyddion exports are monotone in x: only sort when they are not
+    d = np.diff(x)
+    if (d >= 0).all():
+        return x, z
+    if (d <= 0).all():
+        return x[::-1], z[::-1]  # reversed views, no copy
+
+    order = np.argsort(x, kind="stable")
+    return x[order], z[order]
 
 
 def load_profile_txt(path: str):
 
-    xs, zs = [], []
+    header_rows = _count_header_rows(path)
+
+    # Fast path: parse the whole numeric block in C. Only whitespace-separated
+    # columns are detected here; other layouts (e.g. "1.0,2.0") go to the
+    # regex parser below
+    arr = None
+    if header_rows is not None:
+        try:
+            arr = np.loadtxt(path, comments=("#", ";"), skiprows=header_rows,
+                             usecols=(0, 1), dtype=np.float64, ndmin=2,
+                             encoding="utf-8")
+        except ValueError:
+            arr = None
+
+    if arr is not None:
+        if arr.shape[0] < 3:
+            raise ValueError("Not enough numeric data lines found.")
+
+        return _sort_by_x(arr[:, 0], arr[:, 1])
+
+    # Slow path: irregular lines (stray text, gwyddion lines mixed in the data)
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            s = line.strip()
-            if not s:
-                continue
-            if s.startswith("#") or s.startswith(";") or s.lower().startswith("gwyddion"):
-                continue
-
-            nums = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", s)
-            if len(nums) >= 2:
-                xs.append(float(nums[0]))
-                zs.append(float(nums[1]))
-
-    if len(xs) < 3:
+        lines = f.readlines()
+
+    # One row per line at most: fill preallocated arrays, trim to the rows found
+    x = np.empty(len(lines), dtype=np.float64)
+    z = np.empty(len(lines), dtype=np.float64)
+    n = 0
+    for line in lines:
+        s = line.strip()
+        if not s:
+            continue
+        if s.startswith("#") or s.startswith(";") or s.lower().startswith("gwyddion"):
+            continue
+
+        nums = re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", s)
+        if len(nums) >= 2:
+            x[n] = float(nums[0])
+            z[n] = float(nums[1])
+            n += 1
+
+    if n < 3:
         raise ValueError("Not enough numeric data lines found.")
 
-    x = np.array(xs)
-    z = np.array(zs)
+    x = x[:n]
+    z = z[:n]
 
-    # sort by x just in case
-    order = np.argsort(x)
-    return x[order], z[order]
+    return _sort_by_x(x, z)
 
 
 def find_local_maxima_around_min(x: np.ndarray, y: np.ndarray):
     
     i_min = int(np.argmin(y))
 
-    # Left local maximum (closest to i_min if plateau)
-    if i_min > 0:
-        left_section = y[: i_min + 1]
-        max_val_left = np.max(left_section)
-        candidates_left = np.where(left_section == max_val_left)[0]
-        i_left = int(candidates_left[-1])  # rightmost = closest to min
-    else:
-        i_left = 0
-
-    # Right local maximum (closest to i_min if plateau)
-    if i_min < len(y) - 1:
-        right_section = y[i_min:]
-        max_val_right = np.max(right_section)
-        candidates_right = np.where(right_section == max_val_right)[0]
-        i_right = int(i_min + candidates_right[0])  # leftmost = closest to min
-    else:
-        i_right = len(y) - 1
+    # Left local maximum (closest to i_min if plateau): argmax returns the first
+    # occurrence, so on the reversed view it is the rightmost one
+    i_left = i_min - int(np.argmax(y[i_min::-1]))
+
+    # Right local maximum (closest to i_min if plateau): leftmost occurrence
+    i_right = i_min + int(np.argmax(y[i_min:]))
 
     return i_left, i_min, i_right
 
 
-def horizontal_amplitude_around_min(x: np.ndarray, y: np.ndarray):
+def profile_metrics(x: np.ndarray, z: np.ndarray):
 
-    i_left, i_min, i_right = find_local_maxima_around_min(x, y)
-    width = float(abs(x[i_right] - x[i_left]))
+    # All non-spline metrics from one set of indices: V_left, V_right and the
+    # horizontal amplitude H (plain scalar arithmetic after the argmins)
+    i_left, i_min, i_right = find_local_maxima_around_min(x, z)
 
-    return width, (i_left, i_min, i_right)
+    z_min = float(z[i_min])
+    v_left = float(z[i_left]) - z_min
+    v_right = float(z[i_right]) - z_min
+    h_width = abs(float(x[i_right]) - float(x[i_left]))
 
+    return (i_left, i_min, i_right), v_left, v_right, h_width
 
-def vertical_amplitudes_left_right(x, z, idxs):
-    
-    i_left, i_min, i_right = idxs
-    v_left = float(z[i_left] - z[i_min])
-    v_right = float(z[i_right] - z[i_min])
 
-    return v_left, v_right
+def build_spline(x, z):
+
+    if SPLINE_KIND == 'pchip':
+        return PchipInterpolator(x, z)
+    return CubicSpline(x, z)
 
 
 def width_metric(x, z, idxs):
@@ -148,44 +221,36 @@ def width_metric(x, z, idxs):
         ref_z = float(z_right)
         search_side = 'left'
 
-    # Build cubic spline
-    cs = CubicSpline(x, z)
+    # Build the interpolating spline (see SPLINE_KIND)
+    cs = build_spline(x, z)
 
     match_x = None
 
-    # Search for zero-crossing of  spline(x) - ref_z  on the correct side
+    # Samples on the search side of the global minimum
     if search_side == 'right':
-        x_lo, x_hi = float(x[i_min]), float(x[-1])
+        search_slice = z[i_min:]
+        search_offset = i_min
     else:
-        x_lo, x_hi = float(x[0]), float(x[i_min])
-
-    # Dense evaluation to find bracket(s) where spline crosses ref_z
-    n_eval = max(1000, 10 * len(x))
-    x_dense = np.linspace(x_lo, x_hi, n_eval)
-    z_dense = cs(x_dense) - ref_z
-
-    # Find sign changes (zero crossings)
-    sign_changes = np.where(np.diff(np.sign(z_dense)))[0]
-
-    if len(sign_changes) > 0:
-        # Pick the crossing closest to the global minimum
-        best = sign_changes[0] if search_side == 'right' else sign_changes[-1]
-        # Linear interpolation between the two bracketing points for precision
-        x_a, x_b = x_dense[best], x_dense[best + 1]
-        z_a, z_b = z_dense[best], z_dense[best + 1]
-        if abs(z_b - z_a) > 0:
-            match_x = float(x_a - z_a * (x_b - x_a) / (z_b - z_a))
-        else:
-            match_x = float((x_a + x_b) / 2.0)
+        search_slice = z[: i_min + 1]
+        search_offset = 0
+
+    # Exact roots of  spline(x) = ref_z  (both spline kinds are piecewise
+    # cubics), including crossings where the spline overshoots between samples
+    roots = cs.solve(ref_z, extrapolate=False)
+    roots = roots[np.isfinite(roots)]
+
+    # Keep the search side and pick the crossing closest to the global minimum
+    if search_side == 'right':
+        roots = roots[roots >= x[i_min]]
+        if len(roots) > 0:
+            match_x = float(roots.min())
+    else:
+        roots = roots[roots <= x[i_min]]
+        if len(roots) > 0:
+            match_x = float(roots.max())
 
     # Fallback: nearest discrete point
     if match_x is None:
-        if search_side == 'right':
-            search_slice = z[i_min:]
-            search_offset = i_min
-        else:
-            search_slice = z[: i_min + 1]
-            search_offset = 0
         diffs = np.abs(search_slice - ref_z)
         best_local = int(np.argmin(diffs))
         fallback_idx = search_offset + best_local
@@ -229,7 +294,27 @@ def format_number(val, decimal_sep='.', precision=':.4g'):
     return formatted
 
 
-def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
+# White outline behind annotation text: keeps it readable over the curve
+# without the per-text rounded bbox layout
+_TEXT_HALO = [pe.withStroke(linewidth=3, foreground='white')]
+
+# One Figure per process, cleared and reused for every profile
+_PROFILE_FIG = None
+
+
+def _profile_figure():
+
+    global _PROFILE_FIG
+    if _PROFILE_FIG is None:
+        fig, ax = plt.subplots(figsize=(12, 7))
+        # Fixed margins (right side reserved for the external legend) instead of
+        # tight_layout / bbox_inches='tight', which each cost an extra render pass
+        fig.subplots_adjust(left=0.08, right=0.80, top=0.93, bottom=0.10)
+        _PROFILE_FIG = fig, ax
+    return _PROFILE_FIG
+
+
+def plot_profile(fig, ax, path, x, z, out_dir, idxs, width_ref_idx,
                  width_match_point, spline, scale=1e9, unit='nm', decimal_sep='.'):
 
     name = os.path.basename(path)
@@ -245,12 +330,13 @@ def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
     w_match_x_d = w_match_x * S
     w_match_z_d = w_match_z * S
 
-    # Global extrema
+    # Global extrema (one pass each); x is sorted, so its range is the end points
     i_max = int(np.argmax(z_d))
     i_min_global = int(np.argmin(z_d))
 
     x_max, z_max = float(x_d[i_max]), float(z_d[i_max])
     x_min, z_min = float(x_d[i_min_global]), float(z_d[i_min_global])
+    x_lo, x_hi = float(x_d[0]), float(x_d[-1])
 
     v_left = float(z_d[i_left] - z_d[i_min_global])
     v_right = float(z_d[i_right] - z_d[i_min_global])
@@ -260,22 +346,27 @@ def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
     w_val = float(abs(w_match_x_d - x_d[width_ref_idx]))
 
     # Calculate plot ranges
-    x_span = float(np.max(x_d) - np.min(x_d))
-    z_span = float(np.max(z_d) - np.min(z_d))
+    x_span = x_hi - x_lo
+    z_span = z_max - z_min
     if x_span == 0:
         x_span = 1.0
     if z_span == 0:
         z_span = 1.0
 
-    # Create figure
-    fig, ax = plt.subplots(figsize=(12, 7))
+    # Reuse the caller's figure
+    ax.clear()
 
     # Plot spline interpolation (smooth curve through data)
+    # (width_metric only root-finds on it, so this is its one dense evaluation;
+    # x is sorted, and the display scaling is done in place)
     if spline is not None:
-        x_fine = np.linspace(float(np.min(x)), float(np.max(x)), 500)
+        x_fine = np.linspace(float(x[0]), float(x[-1]), 500)
         z_fine = spline(x_fine)
-        ax.plot(x_fine * S, z_fine * S, 'r-', linewidth=1.0, alpha=0.5,
-                label='Cubic spline', zorder=2)
+        np.multiply(x_fine, S, out=x_fine)
+        np.multiply(z_fine, S, out=z_fine)
+        spline_label = 'PCHIP spline' if SPLINE_KIND == 'pchip' else 'Cubic spline'
+        ax.plot(x_fine, z_fine, 'r-', linewidth=1.0, alpha=0.5,
+                label=spline_label, zorder=2)
 
     # Plot the profile data points
     ax.plot(x_d, z_d, 'k-', linewidth=1.5, label='Profile', zorder=3)
@@ -321,8 +412,7 @@ def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
         (float(z_d[i_left]) + z_min) / 2.0,
         f"V_L = {format_number(v_left, decimal_sep)} {unit}",
         va="center", ha="right", fontsize=9, fontweight="bold", color='#CC3366',
-        bbox=dict(boxstyle='round,pad=0.2', facecolor='white',
-                  edgecolor='#CC3366', alpha=0.8)
+        path_effects=_TEXT_HALO,
     )
 
     # ---- V_right annotation (right local max → global min) ----
@@ -339,12 +429,11 @@ def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
         (float(z_d[i_right]) + z_min) / 2.0,
         f"V_R = {format_number(v_right, decimal_sep)} {unit}",
         va="center", ha="left", fontsize=9, fontweight="bold", color='#3366CC',
-        bbox=dict(boxstyle='round,pad=0.2', facecolor='white',
-                  edgecolor='#3366CC', alpha=0.8)
+        path_effects=_TEXT_HALO,
     )
 
     # ---- Horizontal amplitude annotation (between local maxima) ----
-    y_arrow = float(np.min(z_d) - 0.14 * z_span)
+    y_arrow = z_min - 0.14 * z_span
     ax.annotate(
         "",
         xy=(x_d[i_left], y_arrow),
@@ -357,8 +446,7 @@ def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
         y_arrow - 0.05 * z_span,
         f"H = {format_number(h_amp, decimal_sep)} {unit}",
         va="top", ha="center", fontsize=10, fontweight="bold", color='green',
-        bbox=dict(boxstyle='round,pad=0.3', facecolor='white',
-                  edgecolor='green', alpha=0.8)
+        path_effects=_TEXT_HALO,
     )
 
     # Dashed guide lines for H metric
@@ -378,8 +466,7 @@ def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
         mid_z_w + 0.06 * z_span,
         f"W = {format_number(w_val, decimal_sep)} {unit}",
         va="bottom", ha="center", fontsize=9, fontweight="bold", color='darkcyan',
-        bbox=dict(boxstyle='round,pad=0.2', facecolor='white',
-                  edgecolor='darkcyan', alpha=0.8)
+        path_effects=_TEXT_HALO,
     )
 
     # Labels and title
@@ -392,18 +479,14 @@ def plot_profile(path, x, z, out_dir, idxs, width_ref_idx,
     ax.grid(True, alpha=0.3, linestyle=':', linewidth=0.5)
 
     # Expand limits to keep annotations visible
-    x_left_pad = max(0.10 * x_span, abs(x_vl - np.min(x_d)) + 0.08 * x_span)
-    x_right_pad = max(0.12 * x_span, abs(x_vr - np.max(x_d)) + 0.14 * x_span)
-    ax.set_xlim(float(np.min(x_d) - x_left_pad),
-                float(np.max(x_d) + x_right_pad))
-    ax.set_ylim(float(y_arrow - 0.10 * z_span),
-                float(np.max(z_d) + 0.10 * z_span))
-
-    plt.tight_layout()
+    x_left_pad = max(0.10 * x_span, abs(x_vl - x_lo) + 0.08 * x_span)
+    x_right_pad = max(0.12 * x_span, abs(x_vr - x_hi) + 0.14 * x_span)
+    ax.set_xlim(x_lo - x_left_pad, x_hi + x_right_pad)
+    ax.set_ylim(y_arrow - 0.10 * z_span,
+                z_max + 0.10 * z_span)
 
     out_path = os.path.join(out_dir, f"{stem}_profile.png")
-    plt.savefig(out_path, dpi=300, bbox_inches='tight')
-    plt.close(fig)
+    fig.savefig(out_path, dpi=DPI, **PNG_SAVE_KW)
 
     return out_path
 
@@ -426,10 +509,16 @@ def save_results_to_csv(per_file_results, summary_stats, output_path, unit='m',
             'Width'
         ])
 
-        for name, vl, vr, vh, vlo, h, w in per_file_results:
-            def fmt(val):
-                return format_number(val, decimal_sep, precision=':.10g')
-            writer.writerow([name, fmt(vl), fmt(vr), fmt(vh), fmt(vlo), fmt(h), fmt(w)])
+        # Format every per-file value in one vectorized pass (same output as
+        # format_number with ':.10g')
+        if per_file_results:
+            names = [row[0] for row in per_file_results]
+            vals = np.array([row[1:] for row in per_file_results], dtype=float)
+            strs = np.char.mod('%.10g', vals)
+            if decimal_sep == ',':
+                strs = np.char.replace(strs, '.', ',')
+            strs = np.where(np.isfinite(vals), strs, 'NaN')
+            writer.writerows(zip(names, *strs.T))
 
         writer.writerow([])
         writer.writerow(['=== SUMMARY STATISTICS ==='])
@@ -450,6 +539,24 @@ def save_results_to_csv(per_file_results, summary_stats, output_path, unit='m',
             ])
 
 
+def process_one(path, plots_dir, scale, unit, decimal_sep):
+
+    # Full pipeline for one profile (top-level so it can run in a worker process)
+    name = os.path.basename(path)
+    x, z = load_profile_txt(path)
+
+    idxs, vl, vr, h_width = profile_metrics(x, z)
+    w, w_ref, w_match_pt, spline = width_metric(x, z, idxs)
+
+    fig, ax = _profile_figure()
+    out_plot = plot_profile(fig, ax, path, x, z, plots_dir, idxs,
+                            w_ref, w_match_pt, spline,
+                            scale=scale, unit=unit, decimal_sep=decimal_sep)
+
+    # Apply scale for CSV and display
+    return name, vl * scale, vr * scale, h_width * scale, w * scale, out_plot
+
+
 def main():
 
     print("=" * 70)
@@ -510,52 +617,43 @@ def main():
         unit = 'nm'
         print("  → Output will be in NANOMETERS.\n")
 
-    per_file = []
-    vlamps, vramps, vhamps, vloamps, hamps, wamps = [], [], [], [], [], []
+    names = [os.path.basename(path) for path in files]
+    vlamps = np.full(len(files), np.nan)
+    vramps = np.full(len(files), np.nan)
+    hamps = np.full(len(files), np.nan)
+    wamps = np.full(len(files), np.nan)
     plot_paths = []
 
     print(f"\nFound {len(files)} .txt file(s). Processing...\n")
 
-    for i, path in enumerate(files, 1):
-        name = os.path.basename(path)
-        print(f"  [{i}/{len(files)}] Processing: {name}...", end=" ")
-        try:
-            x, z = load_profile_txt(path)
-
-            h_width, idxs = horizontal_amplitude_around_min(x, z)
-            vl, vr = vertical_amplitudes_left_right(x, z, idxs)
-            w, w_ref, w_match_pt, spline = width_metric(x, z, idxs)
-
-            # V_High and V_Low (computed in original meter scale)
-            v_high = max(vl, vr)
-            v_low = min(vl, vr)
-
-            out_plot = plot_profile(path, x, z, plots_dir, idxs,
-                                   w_ref, w_match_pt, spline,
-                                   scale=scale, unit=unit, decimal_sep=decimal_sep)
-
-            # Apply scale for CSV and display
-            vl_s = vl * scale
-            vr_s = vr * scale
-            vh_s = v_high * scale
-            vlo_s = v_low * scale
-            h_s = h_width * scale
-            w_s = w * scale
-
-            per_file.append((name, vl_s, vr_s, vh_s, vlo_s, h_s, w_s))
-            vlamps.append(vl_s)
-            vramps.append(vr_s)
-            vhamps.append(vh_s)
-            vloamps.append(vlo_s)
-            hamps.append(h_s)
-            wamps.append(w_s)
-            plot_paths.append(out_plot)
-
-            print("-> SUCCESSFUL !")
-
-        except Exception as e:
-            per_file.append((name, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan))
-            print(f"-> ERROR: {e}")
+    # Files are independent: process them in parallel, results are collected in file order
+    n_workers = min(len(files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(process_one, path, plots_dir, scale, unit, decimal_sep)
+                   for path in files]
+
+        for i, future in enumerate(futures, 1):
+            name = names[i - 1]
+            try:
+                name, vl_s, vr_s, h_s, w_s, out_plot = future.result()
+
+                vlamps[i - 1] = vl_s
+                vramps[i - 1] = vr_s
+                hamps[i - 1] = h_s
+                wamps[i - 1] = w_s
+                plot_paths.append(out_plot)
+
+                print(f"  [{i}/{len(files)}] Processing: {name}... -> SUCCESSFUL !")
+
+            except Exception as e:
+                # failed files keep their NaN row
+                print(f"  [{i}/{len(files)}] Processing: {name}... -> ERROR: {e}")
+
+    # V_High and V_Low for all profiles at once (NaN where the file failed)
+    vhamps = np.fmax(vlamps, vramps)
+    vloamps = np.fmin(vlamps, vramps)
+
+    per_file = list(zip(names, vlamps, vramps, vhamps, vloamps, hamps, wamps))
 
     # Print per-file results
     print(f"\n" + "=" * 120)
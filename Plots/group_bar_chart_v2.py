@@ -1,5 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.collections import PatchCollection
+from matplotlib.patches import Patch, Rectangle
 
 # Define your data
 ranges = ['[0-7]', '[7-35]', '[35-62]', '[62-90]', '[90-118]','[118-145]','[145-173]','[173-201]','[201-229]','[229-256]','[256-700]','[700-3470]']
@@ -24,10 +26,21 @@ group_spacing = 1.0  # total width allocated to each group (default is 0.8)
 # Calculate positions so bars are centered within each group
 fig, ax = plt.subplots(figsize=(19, 11.5))
 
-for i, (treatment, percentages) in enumerate(data.items()):
-    # Center the bars around each x position
-    offset = (i - n_treatments/2 + 0.5) * width
-    ax.bar(x + offset, percentages, width, label=treatment)
+# Center the bars around each x position
+offsets = (np.arange(n_treatments) - n_treatments/2 + 0.5) * width
+heights = np.array(list(data.values()))  # shape (n_treatments, n_ranges)
+colors = [f'C{i}' for i in range(n_treatments)]  # default color cycle, one per treatment
+
+# All bars as a single collection (one artist instead of one Rectangle per bar)
+bars = [Rectangle((x[j] + offsets[i] - width/2, 0), width, heights[i, j])
+        for i in range(n_treatments) for j in range(len(ranges))]
+bar_colors = [colors[i] for i in range(n_treatments) for j in range(len(ranges))]
+ax.add_collection(PatchCollection(bars, facecolors=bar_colors, edgecolors='none'))
+ax.autoscale_view()
+
+# Legend through proxy handles (the collection has no per-treatment labels)
+legend_handles = [Patch(facecolor=colors[i], label=treatment)
+                  for i, treatment in enumerate(data)]
 
 # Customize the plot
 ax.set_xlabel('Penetration Depth (nm)', fontsize=10)
@@ -36,7 +49,7 @@ ax.set_ylabel('Percentage Sodium (%)', fontsize=10)
 ax.set_xticks(x)
 ax.set_xticklabels(ranges)
 #ax.legend(title='Temperature', loc='upper right')
-ax.legend(title='Temperature', bbox_to_anchor=(0.5, 1.0),loc='upper center', ncol=7) 
+ax.legend(handles=legend_handles, title='Temperature', bbox_to_anchor=(0.5, 1.0),loc='upper center', ncol=7) 
 
 ax.set_ylim(0, 10)
 ax.grid(axis='y', alpha=0.3)
@@ -77,15 +77,9 @@ def parse_xnra_file(filepath):
     """
     print(f"Reading file: {filepath}")
     
-    # Parse XML
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    
-    # Define namespaces
-    ns = {
-        'idf': 'http://idf.schemas.itn.pt',
-        'simnra': 'http://www.simnra.com/simnra'
-    }
+    # Clark-notation tags as produced by iterparse
+    IDF = '{http://idf.schemas.itn.pt}'
+    SIMNRA = '{http://www.simnra.com/simnra}'
     
     # Initialize data dictionary
     data = {
@@ -103,57 +97,63 @@ def parse_xnra_file(filepath):
         'resolution': None
     }
     
-    # Extract filename
-    filename_node = root.find('.//idf:filename', ns)
-    if filename_node is not None:
-        data['filename'] = filename_node.text
-    
-    # Extract beam parameters
-    beam_particle_node = root.find('.//idf:beamparticle', ns)
-    if beam_particle_node is not None:
-        data['beam_particle'] = beam_particle_node.text
-    
-    beam_energy_node = root.find('.//idf:beamenergy', ns)
-    if beam_energy_node is not None:
-        data['beam_energy'] = float(beam_energy_node.text)
-    
-    # Extract geometry
-    scattering_angle_node = root.find('.//idf:scatteringangle', ns)
-    if scattering_angle_node is not None:
-        data['scattering_angle'] = float(scattering_angle_node.text)
+    # Single-value fields (key, is_number): first occurrence in the document wins
+    text_fields = {
+        IDF + 'filename': ('filename', False),
+        IDF + 'beamparticle': ('beam_particle', False),
+        IDF + 'beamenergy': ('beam_energy', True),
+        IDF + 'scatteringangle': ('scattering_angle', True),
+        IDF + 'detectortype': ('detector_type', False),
+    }
+    calibration_path = [IDF + 'energycalibration', IDF + 'calibrationparameters']
+    resolution_path = [IDF + 'detectorresolution', IDF + 'resolutionparameters']
+    
+    # Stream the XML instead of building the whole tree: the channel data are
+    # long number strings, each <simpledata> is freed as soon as it is read
+    stack = []
+    calibration_params = []
+    calibration_done = False
+    for event, elem in ET.iterparse(filepath, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem.tag)
+            continue
+        
+        stack.pop()
+        tag = elem.tag
+        parent = stack[-1] if stack else None
+        
+        if tag in text_fields:
+            key, is_number = text_fields[tag]
+            if data[key] is None:
+                data[key] = float(elem.text) if is_number else elem.text
+        
+        # Extract calibration (parameters of the first energy calibration)
+        elif tag == IDF + 'calibrationparameter':
+            if not calibration_done and stack[-2:] == calibration_path:
+                calibration_params.append(float(elem.text))
+        elif tag == IDF + 'energycalibration':
+            calibration_done = calibration_done or len(calibration_params) > 0
+        
+        # Extract detector resolution (first parameter)
+        elif tag == IDF + 'resolutionparameter':
+            if data['resolution'] is None and stack[-2:] == resolution_path:
+                data['resolution'] = float(elem.text)
+        
+        # Extract raw / smoothed data, parsed straight into arrays in C
+        elif tag == IDF + 'simpledata':
+            if parent == IDF + 'data' and data['raw_channels'] is None:
+                data['raw_channels'] = np.fromstring(elem.find(IDF + 'x').text, sep=' ')
+                data['raw_counts'] = np.fromstring(elem.find(IDF + 'y').text, sep=' ')
+                print(f"  ✓ Raw data: {len(data['raw_channels'])} channels")
+            elif parent == SIMNRA + 'smootheddata' and data['smoothed_channels'] is None:
+                data['smoothed_channels'] = np.fromstring(elem.find(IDF + 'x').text, sep=' ')
+                data['smoothed_counts'] = np.fromstring(elem.find(IDF + 'y').text, sep=' ')
+                print(f"  ✓ Smoothed data: {len(data['smoothed_channels'])} channels")
+            elem.clear()
     
-    # Extract calibration
-    calibration_params = root.findall('.//idf:energycalibration[1]/idf:calibrationparameters/idf:calibrationparameter', ns)
     if len(calibration_params) >= 2:
-        data['calibration_offset'] = float(calibration_params[0].text)
-        data['calibration_gain'] = float(calibration_params[1].text)
-    
-    # Extract detector info
-    detector_node = root.find('.//idf:detectortype', ns)
-    if detector_node is not None:
-        data['detector_type'] = detector_node.text
-    
-    resolution_node = root.find('.//idf:detectorresolution[1]/idf:resolutionparameters/idf:resolutionparameter', ns)
-    if resolution_node is not None:
-        data['resolution'] = float(resolution_node.text)
-    
-    # Extract raw data
-    raw_data = root.find('.//idf:data/idf:simpledata', ns)
-    if raw_data is not None:
-        x_text = raw_data.find('idf:x', ns).text
-        y_text = raw_data.find('idf:y', ns).text
-        data['raw_channels'] = np.array([float(x) for x in x_text.split()])
-        data['raw_counts'] = np.array([float(y) for y in y_text.split()])
-        print(f"  ✓ Raw data: {len(data['raw_channels'])} channels")
-    
-    # Extract smoothed data
-    smoothed_data = root.find('.//simnra:smootheddata/idf:simpledata', ns)
-    if smoothed_data is not None:
-        x_text = smoothed_data.find('idf:x', ns).text
-        y_text = smoothed_data.find('idf:y', ns).text
-        data['smoothed_channels'] = np.array([float(x) for x in x_text.split()])
-        data['smoothed_counts'] = np.array([float(y) for y in y_text.split()])
-        print(f"  ✓ Smoothed data: {len(data['smoothed_channels'])} channels")
+        data['calibration_offset'] = calibration_params[0]
+        data['calibration_gain'] = calibration_params[1]
     
     return data
 
@@ -12,11 +12,28 @@ Author: Your Name
 Date: 2025-12-11
 """
 
+import json
+import hashlib
 import xml.etree.ElementTree as ET
 import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
 
+# Dense spectra: let Agg drop near-collinear vertices of the long data lines
+# (the interactive backend is kept - these scripts show the plot in a window)
+plt.rcParams['path.simplify'] = True
+plt.rcParams['path.simplify_threshold'] = 1.0
+plt.rcParams['agg.path.chunksize'] = 10000
+
+# Optional C-backed XML parser; falls back to ElementTree
+try:
+    from lxml import etree as LXML_ET
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+XML_PARSE_ERRORS = (ET.ParseError, LXML_ET.XMLSyntaxError) if LXML_AVAILABLE else (ET.ParseError,)
+
 # ============================================================================
 # CONFIGURATION - CHANGE THESE VALUES TO CUSTOMIZE THE PLOT
 # ============================================================================
@@ -26,7 +43,8 @@ FILE_PATH = r"C:\Users\berke\Desktop\Giuseppe\input\NRA Re 550 RIC 166°.xnra"
 
 # PLOT APPEARANCE
 FIGURE_SIZE = (14, 6)           # Width, height in inches
-DPI = 100                       # Resolution (higher = sharper but slower)
+DPI = 72                        # Screen resolution of the plot window (higher = sharper but slower)
+SAVE_DPI = 150                  # Resolution of images saved from the window toolbar
 
 # COLORS
 RAW_DATA_COLOR = 'blue'         # Color for raw data points
@@ -58,6 +76,7 @@ SHOW_SMOOTHED_DATA = True       # Show smoothed line?
 SHOW_GRID = True                # Show grid lines?
 SHOW_LEGEND = True              # Show legend?
 SHOW_INFO_BOX = True            # Show info box with parameters?
+CACHE_PARSED_DATA = False       # Cache parsed arrays in a .npz next to the .xnra for reruns?
 
 # AXIS STYLE (SIMNRA-like)
 DUAL_X_AXES = True              # Show both Channel and Energy axes?
@@ -67,17 +86,74 @@ ENERGY_ON_TOP = True            # Energy on top, Channel on bottom (SIMNRA style
 # END CONFIGURATION
 # ============================================================================
 
+# Tag of this script's cached data (v2/v3 return differently shaped dicts)
+_CACHE_TAG = 'nra_converter_v2'
+
+
+def _script_hash():
+    """Hash of this script's source: any change to the parser invalidates the disk cache"""
+    try:
+        with open(__file__, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+    except (NameError, OSError):
+        return None  # no source file (code pasted into a console): no disk cache
+
+
+_SCRIPT_HASH = _script_hash()
+
+
+def _cache_path(filepath):
+    """Cache file stored next to the .xnra file (one per script, see _CACHE_TAG)"""
+    filepath = Path(filepath)
+    return filepath.with_name(f"{filepath.name}.{_CACHE_TAG}.npz")
+
+
+def _load_cached_spectrum(filepath):
+    """Return the cached parse of filepath, or None if missing or stale"""
+    cache = _cache_path(filepath)
+    if _SCRIPT_HASH is None or not cache.exists():
+        return None
+    stat = Path(filepath).stat()
+    try:
+        with np.load(cache) as npz:
+            meta = json.loads(str(npz['meta']))
+            if meta.pop('_key') != [stat.st_mtime_ns, stat.st_size, _SCRIPT_HASH]:
+                return None
+            arrays = {name: npz[name] for name in npz.files if name != 'meta'}
+    except (OSError, ValueError, KeyError):
+        return None
+    meta.update(arrays)
+    return meta
+
+
+def _save_cached_spectrum(filepath, data):
+    """Save arrays + metadata of a parsed spectrum, keyed on mtime, size and script hash"""
+    if _SCRIPT_HASH is None:
+        return
+    stat = Path(filepath).stat()
+    arrays = {k: v for k, v in data.items() if isinstance(v, np.ndarray)}
+    meta = {k: v for k, v in data.items() if not isinstance(v, np.ndarray)}
+    meta['_key'] = [stat.st_mtime_ns, stat.st_size, _SCRIPT_HASH]
+    try:
+        np.savez_compressed(_cache_path(filepath), meta=np.array(json.dumps(meta)), **arrays)
+    except OSError:
+        pass  # read-only folder: just parse again next time
+
+
 def parse_xnra_file(filepath):
     """Parse XNRA file and extract spectrum data and metadata"""
     print(f"Reading file: {filepath}")
     
-    tree = ET.parse(filepath)
-    root = tree.getroot()
+    # Unchanged file parsed before: load the arrays instead of the XML
+    if CACHE_PARSED_DATA:
+        data = _load_cached_spectrum(filepath)
+        if data is not None:
+            print(f"  ✓ Loaded parsed data from cache: {_cache_path(filepath).name}")
+            return data
     
-    ns = {
-        'idf': 'http://idf.schemas.itn.pt',
-        'simnra': 'http://www.simnra.com/simnra'
-    }
+    # Clark-notation tags as produced by iterparse
+    IDF = '{http://idf.schemas.itn.pt}'
+    SIMNRA = '{http://www.simnra.com/simnra}'
     
     data = {
         'filename': None,
@@ -94,54 +170,83 @@ def parse_xnra_file(filepath):
         'resolution': None
     }
     
-    # Extract metadata
-    filename_node = root.find('.//idf:filename', ns)
-    if filename_node is not None:
-        data['filename'] = filename_node.text
-    
-    beam_particle_node = root.find('.//idf:beamparticle', ns)
-    if beam_particle_node is not None:
-        data['beam_particle'] = beam_particle_node.text
-    
-    beam_energy_node = root.find('.//idf:beamenergy', ns)
-    if beam_energy_node is not None:
-        data['beam_energy'] = float(beam_energy_node.text)
-    
-    scattering_angle_node = root.find('.//idf:scatteringangle', ns)
-    if scattering_angle_node is not None:
-        data['scattering_angle'] = float(scattering_angle_node.text)
+    # Single-value fields (key, is_number): first occurrence in the document wins
+    text_fields = {
+        IDF + 'filename': ('filename', False),
+        IDF + 'beamparticle': ('beam_particle', False),
+        IDF + 'beamenergy': ('beam_energy', True),
+        IDF + 'scatteringangle': ('scattering_angle', True),
+        IDF + 'detectortype': ('detector_type', False),
+    }
+    calibration_path = [IDF + 'energycalibration', IDF + 'calibrationparameters']
+    resolution_path = [IDF + 'detectorresolution', IDF + 'resolutionparameters']
+    
+    # Stream the XML instead of building the whole tree: each <simpledata>
+    # block (the long channel strings) is freed as soon as it has been read
+    if LXML_AVAILABLE:
+        events = LXML_ET.iterparse(str(filepath), events=('start', 'end'),
+                                   huge_tree=True, collect_ids=False)
+    else:
+        events = ET.iterparse(filepath, events=('start', 'end'))
+    
+    stack = []
+    calibration_params = []
+    calibration_done = False
+    for event, elem in events:
+        if event == 'start':
+            stack.append(elem.tag)
+            continue
+        
+        stack.pop()
+        tag = elem.tag
+        parent = stack[-1] if stack else None
+        
+        # Extract metadata
+        if tag in text_fields:
+            key, is_number = text_fields[tag]
+            if data[key] is None:
+                data[key] = float(elem.text) if is_number else elem.text
+        
+        # Extract calibration (parameters of the first energy calibration)
+        elif tag == IDF + 'calibrationparameter':
+            if not calibration_done and stack[-2:] == calibration_path:
+                calibration_params.append(float(elem.text))
+        elif tag == IDF + 'energycalibration':
+            calibration_done = calibration_done or len(calibration_params) > 0
+        
+        elif tag == IDF + 'resolutionparameter':
+            if data['resolution'] is None and stack[-2:] == resolution_path:
+                data['resolution'] = float(elem.text)
+        
+        # Extract raw / smoothed data, parsed straight into arrays in C
+        # float32 for channel numbers (integers, exact up to 2**24); counts stay
+        # float64 because smoothed and normalized counts are fractional
+        elif tag == IDF + 'simpledata':
+            if parent == IDF + 'data' and data['raw_channels'] is None:
+                x_text = elem.find(IDF + 'x').text
+                y_text = elem.find(IDF + 'y').text
+                data['raw_channels'] = np.fromstring(x_text, sep=' ', dtype=np.float32)
+                data['raw_counts'] = np.fromstring(y_text, sep=' ')
+                print(f"  ✓ Raw data: {len(data['raw_channels'])} channels")
+            elif parent == SIMNRA + 'smootheddata' and data['smoothed_channels'] is None:
+                x_text = elem.find(IDF + 'x').text
+                y_text = elem.find(IDF + 'y').text
+                data['smoothed_channels'] = np.fromstring(x_text, sep=' ', dtype=np.float32)
+                data['smoothed_counts'] = np.fromstring(y_text, sep=' ')
+                print(f"  ✓ Smoothed data: {len(data['smoothed_channels'])} channels")
+            elem.clear()
+            # lxml keeps every finished element attached to the tree built so
+            # far: drop the blocks already read before this one as well
+            if LXML_AVAILABLE:
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
     
-    # Extract calibration
-    calibration_params = root.findall('.//idf:energycalibration[1]/idf:calibrationparameters/idf:calibrationparameter', ns)
     if len(calibration_params) >= 2:
-        data['calibration_offset'] = float(calibration_params[0].text)
-        data['calibration_gain'] = float(calibration_params[1].text)
-    
-    detector_node = root.find('.//idf:detectortype', ns)
-    if detector_node is not None:
-        data['detector_type'] = detector_node.text
-    
-    resolution_node = root.find('.//idf:detectorresolution[1]/idf:resolutionparameters/idf:resolutionparameter', ns)
-    if resolution_node is not None:
-        data['resolution'] = float(resolution_node.text)
+        data['calibration_offset'] = calibration_params[0]
+        data['calibration_gain'] = calibration_params[1]
     
-    # Extract raw data
-    raw_data = root.find('.//idf:data/idf:simpledata', ns)
-    if raw_data is not None:
-        x_text = raw_data.find('idf:x', ns).text
-        y_text = raw_data.find('idf:y', ns).text
-        data['raw_channels'] = np.array([float(x) for x in x_text.split()])
-        data['raw_counts'] = np.array([float(y) for y in y_text.split()])
-        print(f"  ✓ Raw data: {len(data['raw_channels'])} channels")
-    
-    # Extract smoothed data
-    smoothed_data = root.find('.//simnra:smootheddata/idf:simpledata', ns)
-    if smoothed_data is not None:
-        x_text = smoothed_data.find('idf:x', ns).text
-        y_text = smoothed_data.find('idf:y', ns).text
-        data['smoothed_channels'] = np.array([float(x) for x in x_text.split()])
-        data['smoothed_counts'] = np.array([float(y) for y in y_text.split()])
-        print(f"  ✓ Smoothed data: {len(data['smoothed_channels'])} channels")
+    if CACHE_PARSED_DATA:
+        _save_cached_spectrum(filepath, data)
     
     return data
 
@@ -156,36 +261,53 @@ def energy_to_channel(energy, offset, gain):
     return (energy - offset) / gain
 
 
-def plot_spectrum_dual_axes(data):
+def create_figure():
+    """Create the empty figure and axes for the spectrum plot"""
+    # Drawn at screen DPI (only saved images use SAVE_DPI), reusing the plot
+    # window if it is still open from a previous run
+    plt.rcParams['savefig.dpi'] = SAVE_DPI
+    fig, ax_bottom = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI, num='XNRA Spectrum', clear=True)
+    # Fixed margins (fonts are fixed, so no tight_layout() measuring pass);
+    # the top leaves room for the title and the energy axis
+    fig.subplots_adjust(left=0.07, right=0.98, top=0.85 if DUAL_X_AXES else 0.93, bottom=0.11)
+    fig.patch.set_facecolor(BACKGROUND_COLOR)
+    ax_bottom.set_facecolor(BACKGROUND_COLOR)
+    return fig, ax_bottom
+
+
+def plot_spectrum_dual_axes(data, fig=None, ax_bottom=None):
     """Create matplotlib plot with dual x-axes (Channel + Energy)"""
     print("\nCreating plot with dual x-axes...")
     
-    # Calculate energies
+    # Calibration (energies are only needed for the top axis ticks, the data
+    # itself is plotted against channels - no per-channel energy arrays)
     cal_offset = data['calibration_offset'] if data['calibration_offset'] is not None else 0
     cal_gain = data['calibration_gain'] if data['calibration_gain'] is not None else 1
     
     raw_channels = data['raw_channels']
     raw_counts = data['raw_counts']
-    raw_energy = channel_to_energy(raw_channels, cal_offset, cal_gain)
     
     if data['smoothed_channels'] is not None:
         smoothed_channels = data['smoothed_channels']
         smoothed_counts = data['smoothed_counts']
-        smoothed_energy = channel_to_energy(smoothed_channels, cal_offset, cal_gain)
     
-    # Create figure
-    fig, ax_bottom = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
-    fig.patch.set_facecolor(BACKGROUND_COLOR)
-    ax_bottom.set_facecolor(BACKGROUND_COLOR)
+    # Create figure (unless main() already set it up while parsing)
+    if fig is None or ax_bottom is None:
+        fig, ax_bottom = create_figure()
     
     # Plot data using CHANNELS on the primary (bottom) axis
     if SHOW_RAW_DATA and raw_counts is not None:
-        ax_bottom.plot(raw_channels, raw_counts, 
-                       'o', 
-                       color=RAW_DATA_COLOR,
-                       markersize=RAW_MARKER_SIZE,
-                       alpha=RAW_ALPHA,
-                       label='Raw data')
+        # Marker-only data as one rasterized scatter (s is in points², same
+        # edge as the former 'o' line markers)
+        ax_bottom.scatter(raw_channels, raw_counts,
+                          s=RAW_MARKER_SIZE**2,
+                          marker='o',
+                          c=RAW_DATA_COLOR,
+                          edgecolors=RAW_DATA_COLOR,
+                          linewidths=plt.rcParams['lines.markeredgewidth'],
+                          alpha=RAW_ALPHA,
+                          rasterized=True,
+                          label='Raw data')
         print("  ✓ Plotted raw data")
     
     if SHOW_SMOOTHED_DATA and data['smoothed_counts'] is not None:
@@ -208,13 +330,19 @@ def plot_spectrum_dual_axes(data):
     else:
         ax_bottom.set_xlim(CHANNEL_MIN, raw_channels.max())
     
-    # Create top axis (Energy) using secondary_xaxis
+    # Create top axis (Energy) as a twin axis. The calibration is linear, so
+    # its limits follow from the channel limits and its ticks are placed
+    # directly in keV (no per-tick conversion callbacks on every draw)
     if DUAL_X_AXES:
-        ax_top = ax_bottom.secondary_xaxis('top', 
-                                           functions=(
-                                               lambda ch: channel_to_energy(ch, cal_offset, cal_gain),
-                                               lambda en: energy_to_channel(en, cal_offset, cal_gain)
-                                           ))
+        ax_top = ax_bottom.twiny()
+        
+        def sync_energy_axis(ax):
+            ch_min, ch_max = ax.get_xlim()
+            ax_top.set_xlim(channel_to_energy(ch_min, cal_offset, cal_gain),
+                            channel_to_energy(ch_max, cal_offset, cal_gain))
+        
+        sync_energy_axis(ax_bottom)
+        ax_bottom.callbacks.connect('xlim_changed', sync_energy_axis)
         ax_top.set_xlabel('Energy [keV]', fontsize=AXIS_LABEL_SIZE, fontweight='bold')
         ax_top.tick_params(axis='x', labelsize=TICK_LABEL_SIZE)
         print("  ✓ Added dual x-axes (Channel + Energy)")
@@ -259,8 +387,6 @@ def plot_spectrum_dual_axes(data):
                                   edgecolor='black',
                                   linewidth=1))
     
-    plt.tight_layout()
-    
     print("  ✓ Plot created successfully!")
     print("\n" + "="*60)
     print("PLOT READY - Close the window to exit")
@@ -295,9 +421,10 @@ def main():
             return
         
         # Plot with dual axes
-        plot_spectrum_dual_axes(data)
+        fig, ax_bottom = create_figure()
+        plot_spectrum_dual_axes(data, fig, ax_bottom)
         
-    except ET.ParseError as e:
+    except XML_PARSE_ERRORS as e:
         print(f"\n❌ ERROR: Invalid XML file!")
         print(f"   {e}")
     except Exception as e:
@@ -20,11 +20,29 @@ Author: Your Name
 Date: 2025-12-12
 """
 
+import json
+import hashlib
 import xml.etree.ElementTree as ET
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.widgets import Slider, RangeSlider
 from pathlib import Path
 
+# Dense spectra: let Agg drop near-collinear vertices of the long data lines
+# (the interactive backend is kept - these scripts show the plot in a window)
+plt.rcParams['path.simplify'] = True
+plt.rcParams['path.simplify_threshold'] = 1.0
+plt.rcParams['agg.path.chunksize'] = 10000
+
+# Optional C-backed XML parser; falls back to ElementTree
+try:
+    from lxml import etree as LXML_ET
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+XML_PARSE_ERRORS = (ET.ParseError, LXML_ET.XMLSyntaxError) if LXML_AVAILABLE else (ET.ParseError,)
+
 # ============================================================================
 # CONFIGURATION - CUSTOMIZE YOUR PLOT HERE
 # ============================================================================
@@ -35,7 +53,8 @@ FILE_PATH = r"C:\Users\berke\Desktop\Giuseppe\input\RBS\RBS_NT_166°_NORM_v2.xnr
 
 # ==================== WINDOW SETTINGS ====================
 FIGURE_SIZE = (14, 8)           # Width x Height in inches
-DPI = 100                       # Resolution (higher = sharper)
+DPI = 72                        # Screen resolution of the plot window (higher = sharper)
+SAVE_DPI = 150                  # Resolution of images saved from the window toolbar
 
 # ==================== RAW DATA APPEARANCE ====================
 # --- Markers ---
@@ -97,12 +116,68 @@ CHANNEL_MAX = 1600                     # Maximum channel (None = auto)
 # ==================== DISPLAY OPTIONS ====================
 SHOW_LEGEND = True                     # Show legend?
 SHOW_INFO_BOX = True                   # Show info box?
+CACHE_PARSED_DATA = False              # Cache parsed arrays in a .npz next to the .xnra for reruns?
+INTERACTIVE_CONTROLS = False           # Sliders for raw marker alpha/range below the plot?
 
 # ============================================================================
 # END CONFIGURATION
 # ============================================================================
 
 
+# Tag of this script's cached data (v2/v3 return differently shaped dicts)
+_CACHE_TAG = 'nra_converter_v3'
+
+
+def _script_hash():
+    """Hash of this script's source: any change to the parser invalidates the disk cache"""
+    try:
+        with open(__file__, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+    except (NameError, OSError):
+        return None  # no source file (code pasted into a console): no disk cache
+
+
+_SCRIPT_HASH = _script_hash()
+
+
+def _cache_path(filepath):
+    """Cache file stored next to the .xnra file (one per script, see _CACHE_TAG)"""
+    filepath = Path(filepath)
+    return filepath.with_name(f"{filepath.name}.{_CACHE_TAG}.npz")
+
+
+def _load_cached_spectrum(filepath):
+    """Return the cached parse of filepath, or None if missing or stale"""
+    cache = _cache_path(filepath)
+    if _SCRIPT_HASH is None or not cache.exists():
+        return None
+    stat = Path(filepath).stat()
+    try:
+        with np.load(cache) as npz:
+            meta = json.loads(str(npz['meta']))
+            if meta.pop('_key') != [stat.st_mtime_ns, stat.st_size, _SCRIPT_HASH]:
+                return None
+            arrays = {name: npz[name] for name in npz.files if name != 'meta'}
+    except (OSError, ValueError, KeyError):
+        return None
+    meta.update(arrays)
+    return meta
+
+
+def _save_cached_spectrum(filepath, data):
+    """Save arrays + metadata of a parsed spectrum, keyed on mtime, size and script hash"""
+    if _SCRIPT_HASH is None:
+        return
+    stat = Path(filepath).stat()
+    arrays = {k: v for k, v in data.items() if isinstance(v, np.ndarray)}
+    meta = {k: v for k, v in data.items() if not isinstance(v, np.ndarray)}
+    meta['_key'] = [stat.st_mtime_ns, stat.st_size, _SCRIPT_HASH]
+    try:
+        np.savez_compressed(_cache_path(filepath), meta=np.array(json.dumps(meta)), **arrays)
+    except OSError:
+        pass  # read-only folder: just parse again next time
+
+
 def parse_xnra_file(filepath):
     """
     Parse XNRA file and extract all data and metadata.
@@ -115,69 +190,114 @@ def parse_xnra_file(filepath):
     """
     print(f"📂 Reading file: {filepath}")
     
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    
-    # XML namespaces
-    ns = {
-        'idf': 'http://idf.schemas.itn.pt',
-        'simnra': 'http://www.simnra.com/simnra'
+    # Unchanged file parsed before: load the arrays instead of the XML
+    if CACHE_PARSED_DATA:
+        data = _load_cached_spectrum(filepath)
+        if data is not None:
+            print(f"✓ Loaded parsed data from cache: {_cache_path(filepath).name}")
+            return data
+    
+    # Clark-notation tags as produced by iterparse
+    IDF = '{http://idf.schemas.itn.pt}'
+    SIMNRA = '{http://www.simnra.com/simnra}'
+    
+    data = {
+        'filename': None,
+        'beam_particle': None,
+        'beam_energy': None,
+        'scattering_angle': None,
+        'detector_type': None,
+        'resolution': None,
+        'raw_channels': None,
+        'raw_counts': None,
+        'smoothed_channels': None,
+        'smoothed_counts': None,
     }
     
-    data = {}
-    
-    # ========== Extract Metadata ==========
-    filename_node = root.find('.//idf:filename', ns)
-    data['filename'] = filename_node.text if filename_node is not None else "XNRA Spectrum"
-    
-    beam_particle_node = root.find('.//idf:beamparticle', ns)
-    data['beam_particle'] = beam_particle_node.text if beam_particle_node is not None else None
-    
-    beam_energy_node = root.find('.//idf:beamenergy', ns)
-    data['beam_energy'] = float(beam_energy_node.text) if beam_energy_node is not None else None
-    
-    scattering_angle_node = root.find('.//idf:scatteringangle', ns)
-    data['scattering_angle'] = float(scattering_angle_node.text) if scattering_angle_node is not None else None
-    
-    detector_node = root.find('.//idf:detectortype', ns)
-    data['detector_type'] = detector_node.text if detector_node is not None else None
-    
-    resolution_node = root.find('.//idf:detectorresolution[1]/idf:resolutionparameters/idf:resolutionparameter', ns)
-    data['resolution'] = float(resolution_node.text) if resolution_node is not None else None
+    # Single-value fields (key, is_number): first occurrence in the document wins
+    text_fields = {
+        IDF + 'filename': ('filename', False),
+        IDF + 'beamparticle': ('beam_particle', False),
+        IDF + 'beamenergy': ('beam_energy', True),
+        IDF + 'scatteringangle': ('scattering_angle', True),
+        IDF + 'detectortype': ('detector_type', False),
+    }
+    calibration_path = [IDF + 'energycalibration', IDF + 'calibrationparameters']
+    resolution_path = [IDF + 'detectorresolution', IDF + 'resolutionparameters']
+    
+    # Stream the XML instead of building the whole tree: each <simpledata>
+    # block (the long channel strings) is freed as soon as it has been read
+    if LXML_AVAILABLE:
+        events = LXML_ET.iterparse(str(filepath), events=('start', 'end'),
+                                   huge_tree=True, collect_ids=False)
+    else:
+        events = ET.iterparse(filepath, events=('start', 'end'))
+    
+    stack = []
+    cal_params = []
+    cal_done = False
+    for event, elem in events:
+        if event == 'start':
+            stack.append(elem.tag)
+            continue
+        
+        stack.pop()
+        tag = elem.tag
+        parent = stack[-1] if stack else None
+        
+        # ========== Extract Metadata ==========
+        if tag in text_fields:
+            key, is_number = text_fields[tag]
+            if data[key] is None:
+                data[key] = float(elem.text) if is_number else elem.text
+        
+        elif tag == IDF + 'resolutionparameter':
+            if data['resolution'] is None and stack[-2:] == resolution_path:
+                data['resolution'] = float(elem.text)
+        
+        # ========== Extract Calibration (first energy calibration) ==========
+        elif tag == IDF + 'calibrationparameter':
+            if not cal_done and stack[-2:] == calibration_path:
+                cal_params.append(float(elem.text))
+        elif tag == IDF + 'energycalibration':
+            cal_done = cal_done or len(cal_params) > 0
+        
+        # ========== Extract Raw / Smoothed Data ==========
+        # float32 for channel numbers (integers, exact up to 2**24); counts stay
+        # float64 because smoothed and normalized counts are fractional
+        elif tag == IDF + 'simpledata':
+            if parent == IDF + 'data' and data['raw_channels'] is None:
+                x_text = elem.find(IDF + 'x').text
+                y_text = elem.find(IDF + 'y').text
+                data['raw_channels'] = np.fromstring(x_text, sep=' ', dtype=np.float32)
+                data['raw_counts'] = np.fromstring(y_text, sep=' ')
+                print(f"✓ Raw data: {len(data['raw_channels'])} channels")
+            elif parent == SIMNRA + 'smootheddata' and data['smoothed_channels'] is None:
+                x_text = elem.find(IDF + 'x').text
+                y_text = elem.find(IDF + 'y').text
+                data['smoothed_channels'] = np.fromstring(x_text, sep=' ', dtype=np.float32)
+                data['smoothed_counts'] = np.fromstring(y_text, sep=' ')
+                print(f"✓ Smoothed data: {len(data['smoothed_channels'])} channels")
+            elem.clear()
+            # lxml keeps every finished element attached to the tree built so
+            # far: drop the blocks already read before this one as well
+            if LXML_AVAILABLE:
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+    
+    if data['filename'] is None:
+        data['filename'] = "XNRA Spectrum"
     
-    # ========== Extract Calibration ==========
-    cal_params = root.findall('.//idf:energycalibration[1]/idf:calibrationparameters/idf:calibrationparameter', ns)
     if len(cal_params) >= 2:
-        data['cal_offset'] = float(cal_params[0].text)
-        data['cal_gain'] = float(cal_params[1].text)
+        data['cal_offset'] = cal_params[0]
+        data['cal_gain'] = cal_params[1]
     else:
         data['cal_offset'] = 0
         data['cal_gain'] = 1
         print("⚠️  No calibration found, using default (E = Ch)")
     
-    # ========== Extract Raw Data ==========
-    raw_data = root.find('.//idf:data/idf:simpledata', ns)
-    if raw_data is not None:
-        x_text = raw_data.find('idf:x', ns).text
-        y_text = raw_data.find('idf:y', ns).text
-        data['raw_channels'] = np.array([float(x) for x in x_text.split()])
-        data['raw_counts'] = np.array([float(y) for y in y_text.split()])
-        print(f"✓ Raw data: {len(data['raw_channels'])} channels")
-    else:
-        data['raw_channels'] = None
-        data['raw_counts'] = None
-    
-    # ========== Extract Smoothed Data ==========
-    smoothed_data = root.find('.//simnra:smootheddata/idf:simpledata', ns)
-    if smoothed_data is not None:
-        x_text = smoothed_data.find('idf:x', ns).text
-        y_text = smoothed_data.find('idf:y', ns).text
-        data['smoothed_channels'] = np.array([float(x) for x in x_text.split()])
-        data['smoothed_counts'] = np.array([float(y) for y in y_text.split()])
-        print(f"✓ Smoothed data: {len(data['smoothed_channels'])} channels")
-    else:
-        data['smoothed_channels'] = None
-        data['smoothed_counts'] = None
+    if CACHE_PARSED_DATA:
+        _save_cached_spectrum(filepath, data)
     
     return data
 
@@ -228,28 +348,97 @@ def apply_marker_range(channels, counts, range_enabled, range_min, range_max):
     if not range_enabled:
         return channels, counts
     
-    # Find indices within range
-    mask = (channels >= range_min) & (channels <= range_max)
+    # Channels are in ascending order: the range is one contiguous slice,
+    # found by binary search (views, no mask or copies)
+    lo = np.searchsorted(channels, range_min, side='left')
+    hi = np.searchsorted(channels, range_max, side='right')
     
-    if not np.any(mask):
+    if hi <= lo:
         return None, None
     
-    return channels[mask], counts[mask]
+    return channels[lo:hi], counts[lo:hi]
 
 
-def plot_spectrum(data):
+def interactive_view(fig, ax, raw_markers, channels, counts):
+    """
+    Add sliders for the raw marker alpha and channel range.
+    
+    Slider changes only update the (rasterized) marker collection and
+    request a draw_idle(), so a fast drag is coalesced into one redraw
+    per GUI event loop pass. The markers stay a normal artist, so images
+    saved from the toolbar include them.
+    
+    Args:
+        fig: Figure containing the plot
+        ax: Axes holding the raw markers
+        raw_markers: Scatter artist with the raw data markers
+        channels: Array of raw channel values
+        counts: Array of raw count values
+        
+    Returns:
+        tuple: (alpha_slider, range_slider) - keep a reference while the window is open
+    """
+    fig.subplots_adjust(bottom=0.22)
+    alpha_ax = fig.add_axes([0.15, 0.08, 0.65, 0.03])
+    range_ax = fig.add_axes([0.15, 0.03, 0.65, 0.03])
+    
+    if RAW_MARKER_RANGE_ENABLED:
+        range_init = (max(RAW_MARKER_RANGE_MIN, channels[0]), min(RAW_MARKER_RANGE_MAX, channels[-1]))
+    else:
+        range_init = (channels[0], channels[-1])
+    
+    alpha_slider = Slider(alpha_ax, 'Alpha', 0.0, 1.0, valinit=RAW_LINE_ALPHA)
+    range_slider = RangeSlider(range_ax, 'Channels', channels[0], channels[-1],
+                               valinit=range_init, valstep=1)
+    
+    def on_alpha(value):
+        raw_markers.set_alpha(value)
+        fig.canvas.draw_idle()
+    
+    def on_range(value):
+        lo = np.searchsorted(channels, value[0], side='left')
+        hi = np.searchsorted(channels, value[1], side='right')
+        raw_markers.set_offsets(np.column_stack((channels[lo:hi], counts[lo:hi])))
+        fig.canvas.draw_idle()
+    
+    alpha_slider.on_changed(on_alpha)
+    range_slider.on_changed(on_range)
+    
+    return alpha_slider, range_slider
+
+
+def create_figure():
+    """
+    Create the empty figure and axes for the spectrum plot.
+    
+    Returns:
+        tuple: (fig, ax)
+    """
+    # Drawn at screen DPI; only saved images use SAVE_DPI
+    plt.rcParams['savefig.dpi'] = SAVE_DPI
+    # Reuses the plot window if it is still open from a previous run
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI, num='XNRA Spectrum', clear=True)
+    # Fixed margins (fonts are fixed, so no tight_layout() measuring pass);
+    # the top leaves room for the title and the energy axis
+    fig.subplots_adjust(left=0.07, right=0.98, top=0.89, bottom=0.08)
+    fig.patch.set_facecolor(BACKGROUND_COLOR)
+    ax.set_facecolor(BACKGROUND_COLOR)
+    return fig, ax
+
+
+def plot_spectrum(data, fig=None, ax=None):
     """
     Create matplotlib plot with dual x-axes and customizable appearance.
     
     Args:
         data: Dictionary containing spectrum data and metadata
+        fig, ax: Figure and axes from create_figure() (created here if None)
     """
     print("\n🎨 Creating plot...")
     
     # ========== Setup Figure ==========
-    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
-    fig.patch.set_facecolor(BACKGROUND_COLOR)
-    ax.set_facecolor(BACKGROUND_COLOR)
+    if fig is None or ax is None:
+        fig, ax = create_figure()
     
     # ========== Get Data ==========
     raw_channels = data['raw_channels']
@@ -260,6 +449,8 @@ def plot_spectrum(data):
     cal_offset = data['cal_offset']
     cal_gain = data['cal_gain']
     
+    raw_markers = None
+    
     # ========== Plot Raw Data ==========
     if raw_channels is not None and raw_counts is not None:
         # Get marker style
@@ -295,28 +486,24 @@ def plot_spectrum(data):
             
             if marker_channels is not None:
                 # Handle hollow markers
+                # Marker-only data as one rasterized scatter (s is in points²)
                 if RAW_MARKER_FILL.lower() == 'hollow':
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
-                           marker=marker,
-                           markersize=RAW_MARKER_SIZE,
-                           markerfacecolor='none',
-                           markeredgecolor=RAW_MARKER_COLOR,
-                           markeredgewidth=RAW_MARKER_EDGE_WIDTH,
-                           alpha=RAW_LINE_ALPHA,
-                           label='Raw data' if not SHOW_RAW_LINE else '',
-                           zorder=3)
+                    facecolor = 'none'
+                    edgewidth = RAW_MARKER_EDGE_WIDTH
                 else:
-                    # Filled markers
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
-                           marker=marker,
-                           markersize=RAW_MARKER_SIZE,
-                           markerfacecolor=RAW_MARKER_COLOR,
-                           markeredgecolor=RAW_MARKER_COLOR,
-                           alpha=RAW_LINE_ALPHA,
-                           label='Raw data' if not SHOW_RAW_LINE else '',
-                           zorder=3)
+                    # Filled markers (default line-marker edge)
+                    facecolor = RAW_MARKER_COLOR
+                    edgewidth = plt.rcParams['lines.markeredgewidth']
+                raw_markers = ax.scatter(marker_channels, marker_counts,
+                                         s=RAW_MARKER_SIZE**2,
+                                         marker=marker,
+                                         facecolors=facecolor,
+                                         edgecolors=RAW_MARKER_COLOR,
+                                         linewidths=edgewidth,
+                                         alpha=RAW_LINE_ALPHA,
+                                         rasterized=True,
+                                         label='Raw data' if not SHOW_RAW_LINE else '',
+                                         zorder=3)
                 
                 range_info = f" (channels {RAW_MARKER_RANGE_MIN}-{RAW_MARKER_RANGE_MAX})" if RAW_MARKER_RANGE_ENABLED else ""
                 print(f"✓ Plotted raw data markers: {RAW_MARKER_SHAPE}, {RAW_MARKER_FILL}{range_info}")
@@ -349,25 +536,22 @@ def plot_spectrum(data):
             
             if marker_channels is not None:
                 # Handle hollow markers
+                # Markers as one rasterized scatter, like the raw markers
                 if SMOOTHED_MARKER_FILL.lower() == 'hollow':
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
-                           marker=marker,
-                           markersize=SMOOTHED_MARKER_SIZE,
-                           markerfacecolor='none',
-                           markeredgecolor=SMOOTHED_MARKER_COLOR,
-                           markeredgewidth=SMOOTHED_MARKER_EDGE_WIDTH,
-                           alpha=SMOOTHED_LINE_ALPHA,
-                           zorder=4)
+                    facecolor = 'none'
+                    edgewidth = SMOOTHED_MARKER_EDGE_WIDTH
                 else:
-                    # Filled markers
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
+                    # Filled markers (default line-marker edge)
+                    facecolor = SMOOTHED_MARKER_COLOR
+                    edgewidth = plt.rcParams['lines.markeredgewidth']
+                ax.scatter(marker_channels, marker_counts,
+                           s=SMOOTHED_MARKER_SIZE**2,
                            marker=marker,
-                           markersize=SMOOTHED_MARKER_SIZE,
-                           markerfacecolor=SMOOTHED_MARKER_COLOR,
-                           markeredgecolor=SMOOTHED_MARKER_COLOR,
+                           facecolors=facecolor,
+                           edgecolors=SMOOTHED_MARKER_COLOR,
+                           linewidths=edgewidth,
                            alpha=SMOOTHED_LINE_ALPHA,
+                           rasterized=True,
                            zorder=4)
                 
                 range_info = f" (channels {SMOOTHED_MARKER_RANGE_MIN}-{SMOOTHED_MARKER_RANGE_MAX})" if SMOOTHED_MARKER_RANGE_ENABLED else ""
@@ -388,10 +572,17 @@ def plot_spectrum(data):
         ax.set_xlim(CHANNEL_MIN, raw_channels.max())
     
     # Top axis: Energy (dual x-axis)
-    ax_top = ax.secondary_xaxis('top', functions=(
-        lambda ch: cal_offset + cal_gain * ch,      # channel → energy
-        lambda en: (en - cal_offset) / cal_gain     # energy → channel
-    ))
+    # Twin axis with limits mapped through the (linear) calibration: ticks
+    # are placed directly in keV, no per-tick conversion callbacks per draw
+    ax_top = ax.twiny()
+    
+    def sync_energy_axis(axis):
+        ch_min, ch_max = axis.get_xlim()
+        ax_top.set_xlim(cal_offset + cal_gain * ch_min,     # channel → energy
+                        cal_offset + cal_gain * ch_max)
+    
+    sync_energy_axis(ax)
+    ax.callbacks.connect('xlim_changed', sync_energy_axis)
     ax_top.set_xlabel('Energy [keV]', fontsize=AXIS_LABEL_SIZE, fontweight='bold')
     ax_top.tick_params(axis='x', labelsize=TICK_LABEL_SIZE)
     
@@ -443,7 +634,11 @@ def plot_spectrum(data):
                            linewidth=1))
     
     # ========== Finalize ==========
-    plt.tight_layout()
+    # Widgets only stay responsive while referenced, keep them until show() returns
+    controls = None
+    if INTERACTIVE_CONTROLS and raw_markers is not None:
+        controls = interactive_view(fig, ax, raw_markers, raw_channels, raw_counts)
+        print("✓ Added interactive marker sliders")
     
     print("✓ Plot created successfully!")
     print("\n" + "="*60)
@@ -478,9 +673,10 @@ def main():
             return
         
         # Create plot
-        plot_spectrum(data)
+        fig, ax = create_figure()
+        plot_spectrum(data, fig, ax)
         
-    except ET.ParseError as e:
+    except XML_PARSE_ERRORS as e:
         print(f"\n❌ ERROR: Invalid XML file!")
         print(f"   {e}")
     except Exception as e:
@@ -8,10 +8,16 @@
 
 import xml.etree.ElementTree as ET
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
 from pathlib import Path
 import traceback
 
+# Dense spectra: let Agg drop near-collinear vertices of the long data lines
+# (the interactive backend is kept - the plot is shown in a window)
+matplotlib.rcParams['path.simplify'] = True
+matplotlib.rcParams['path.simplify_threshold'] = 1.0
+matplotlib.rcParams['agg.path.chunksize'] = 10000
+
 # ============================================================================
 # USER INPUTS + CONFIGURATION 
 # ============================================================================
@@ -20,6 +26,9 @@ import traceback
 #FILE_PATH = r"C:\Users\berke\Desktop\Giuseppe\input\NRA\NRA Re 550 RIC 166°.xnra"
 FILE_PATH = r"C:\Users\berke\Desktop\Giuseppe\input\RBS\RBS_NT_166°_NORM_v2.xnra"
 
+# Console output
+VERBOSE = False                        # True: report every step, False: one summary line (warnings always shown)
+
 # Visualization window settings 
 FIGURE_SIZE = (12, 6)                  # Width x Height in inches 
 DPI = 100                              # Resolution (higher = sharper)
@@ -98,112 +107,169 @@ CHANNEL_MAX = None                      # set maximum channel displayed
 ENERGY_MIN = None                       # set minimum energy [keV] displayed 
 ENERGY_MAX = None                       # set maximum energy [keV] displayed
 
+#--- Marker density ---
+MAX_MARKERS = 2000                     # max markers drawn per dataset, evenly thinned out (None = all)
+RASTERIZE_LINES = False                # data lines as an image in PDF/SVG exports (smaller, faster files, but blurred when zoomed)
+
 #--- Y-axis limits ---
 #(None = full display)
 COUNTS_MIN = None                      # set minimum counts 
 COUNTS_MAX = None                      # set maxixum counts 
 
+# Option strings lowercased once here, so the plotting code compares them directly
+RAW_MARKER_SHAPE = RAW_MARKER_SHAPE.lower()
+RAW_MARKER_FILL = RAW_MARKER_FILL.lower()
+SMOOTHED_MARKER_SHAPE = SMOOTHED_MARKER_SHAPE.lower()
+SMOOTHED_MARKER_FILL = SMOOTHED_MARKER_FILL.lower()
+X_AXIS_MODE = X_AXIS_MODE.lower()
+INFO_BOX_POSITION = INFO_BOX_POSITION.lower()
+
 # ============================================================================
 # FUNCTIONS
 # ============================================================================
 
+# XML namespaces, as the '{uri}' prefix of the tag names iterparse produces
+IDF = '{http://idf.schemas.itn.pt}'
+SIMNRA = '{http://www.simnra.com/simnra}'
+
+# Single-value fields (key, is_number): first occurrence in the document wins
+TEXT_FIELDS = {
+    IDF + 'filename': ('filename', False),
+    IDF + 'beamparticle': ('beam_particle', False),
+    IDF + 'beamenergy': ('beam_energy', True),
+    IDF + 'scatteringangle': ('scattering_angle', True),
+    IDF + 'detectortype': ('detector_type', False),
+}
+
+# Tags enclosing the parameters that are read (innermost last)
+CALIBRATION_PATH = [IDF + 'energycalibration', IDF + 'calibrationparameters']
+RESOLUTION_PATH = [IDF + 'detectorresolution', IDF + 'resolutionparameters']
+
+# Tags compared in the parse loop
+RESOLUTION_PARAMETER = IDF + 'resolutionparameter'
+CALIBRATION_PARAMETER = IDF + 'calibrationparameter'
+ENERGY_CALIBRATION = IDF + 'energycalibration'
+SIMPLEDATA = IDF + 'simpledata'
+RAW_DATA_PARENT = IDF + 'data'
+SMOOTHED_DATA_PARENT = SIMNRA + 'smootheddata'
+X_TAG = IDF + 'x'
+Y_TAG = IDF + 'y'
+
 def parse_xnra_file(filepath):
 
-    print(f"📂 Reading file: {filepath}")
-    
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    
-    # XML namespaces
-    ns = {
-        'idf': 'http://idf.schemas.itn.pt',
-        'simnra': 'http://www.simnra.com/simnra'
+    if VERBOSE:
+        print(f"📂 Reading file: {filepath}")
+    
+    data = {
+        'filename': None,
+        'beam_particle': None,
+        'beam_energy': None,
+        'scattering_angle': None,
+        'detector_type': None,
+        'resolution': None,
+        'raw_channels': None,
+        'raw_counts': None,
+        'smoothed_channels': None,
+        'smoothed_counts': None,
     }
     
-    data = {}
-    
-    # ========== Extract Metadata ==========
-    filename_node = root.find('.//idf:filename', ns)
-    data['filename'] = filename_node.text if filename_node is not None else "XNRA Spectrum"
-    
-    beam_particle_node = root.find('.//idf:beamparticle', ns)
-    data['beam_particle'] = beam_particle_node.text if beam_particle_node is not None else None
-    
-    beam_energy_node = root.find('.//idf:beamenergy', ns)
-    data['beam_energy'] = float(beam_energy_node.text) if beam_energy_node is not None else None
-    
-    scattering_angle_node = root.find('.//idf:scatteringangle', ns)
-    data['scattering_angle'] = float(scattering_angle_node.text) if scattering_angle_node is not None else None
-    
-    detector_node = root.find('.//idf:detectortype', ns)
-    data['detector_type'] = detector_node.text if detector_node is not None else None
-    
-    resolution_node = root.find('.//idf:detectorresolution[1]/idf:resolutionparameters/idf:resolutionparameter', ns)
-    data['resolution'] = float(resolution_node.text) if resolution_node is not None else None
-    
-    # ========== Extract Calibration ==========
-    cal_params = root.findall('.//idf:energycalibration[1]/idf:calibrationparameters/idf:calibrationparameter', ns)
+    # One streaming pass over the XML instead of a tree plus ~10 './/' searches;
+    # the stack of open tags tells where in the document each element sits
+    stack = []
+    cal_params = []
+    cal_done = False
+    for event, elem in ET.iterparse(filepath, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem.tag)
+            continue
+        
+        stack.pop()
+        tag = elem.tag
+        parent = stack[-1] if stack else None
+        
+        # ========== Extract Metadata ==========
+        if tag in TEXT_FIELDS:
+            key, is_number = TEXT_FIELDS[tag]
+            if data[key] is None:
+                data[key] = float(elem.text) if is_number else elem.text
+        
+        elif tag == RESOLUTION_PARAMETER:
+            if data['resolution'] is None and stack[-2:] == RESOLUTION_PATH:
+                data['resolution'] = float(elem.text)
+        
+        # ========== Extract Calibration (first energy calibration) ==========
+        elif tag == CALIBRATION_PARAMETER:
+            if not cal_done and stack[-2:] == CALIBRATION_PATH:
+                cal_params.append(float(elem.text))
+        elif tag == ENERGY_CALIBRATION:
+            cal_done = cal_done or len(cal_params) > 0
+        
+        # ========== Extract Raw / Smoothed Data ==========
+        # Parsed straight into arrays in C (no Python list of floats)
+        # float32 for channel numbers (integers, exact up to 2**24); counts stay
+        # float64 because smoothed and normalized counts are fractional
+        elif tag == SIMPLEDATA:
+            if parent == RAW_DATA_PARENT and data['raw_channels'] is None:
+                data['raw_channels'] = np.fromstring(elem.find(X_TAG).text, sep=' ', dtype=np.float32)
+                data['raw_counts'] = np.fromstring(elem.find(Y_TAG).text, sep=' ')
+
+            elif parent == SMOOTHED_DATA_PARENT and data['smoothed_channels'] is None:
+                data['smoothed_channels'] = np.fromstring(elem.find(X_TAG).text, sep=' ', dtype=np.float32)
+                data['smoothed_counts'] = np.fromstring(elem.find(Y_TAG).text, sep=' ')
+
+            # Free the element (the long channel strings)
+            elem.clear()
+    
+    if VERBOSE:
+        if data['raw_channels'] is not None:
+            print(f"✓ Raw data: {len(data['raw_channels'])} channels")
+        if data['smoothed_channels'] is not None:
+            print(f"✓ Smoothed data: {len(data['smoothed_channels'])} channels")
+    
+    if data['filename'] is None:
+        data['filename'] = "XNRA Spectrum"
     
     if len(cal_params) >= 2:
-        data['cal_offset'] = float(cal_params[0].text)
-        data['cal_gain'] = float(cal_params[1].text)
-        print("Calibration parameters found !")
+        data['cal_offset'] = cal_params[0]
+        data['cal_gain'] = cal_params[1]
+        if VERBOSE:
+            print("Calibration parameters found !")
 
     else:
         data['cal_offset'] = 0
         data['cal_gain'] = 1
         print("⚠️  No calibration found, using default (E = Ch)")
     
-    # ========== Extract Raw Data ==========
-    raw_data = root.find('.//idf:data/idf:simpledata', ns)
-
-    if raw_data is not None:
-
-        x_text = raw_data.find('idf:x', ns).text
-        y_text = raw_data.find('idf:y', ns).text
-
-        data['raw_channels'] = np.array([float(x) for x in x_text.split()])
-        data['raw_counts'] = np.array([float(y) for y in y_text.split()])
-
-        print(f"✓ Raw data: {len(data['raw_channels'])} channels")
-
-    else:
-        data['raw_channels'] = None
-        data['raw_counts'] = None
+    if not VERBOSE:
+        n_raw = len(data['raw_channels']) if data['raw_channels'] is not None else 0
+        n_smoothed = len(data['smoothed_channels']) if data['smoothed_channels'] is not None else 0
+        print(f"Parsed {Path(filepath).name}: raw={n_raw} channels, smoothed={n_smoothed} channels")
     
-    # ========== Extract Smoothed Data ==========
-    smoothed_data = root.find('.//simnra:smootheddata/idf:simpledata', ns)
+    return data
 
-    if smoothed_data is not None:
 
-        x_text = smoothed_data.find('idf:x', ns).text
-        y_text = smoothed_data.find('idf:y', ns).text
+# Info box frame (matplotlib copies it, so one dict serves every plot)
+INFO_BOX_STYLE = dict(boxstyle='round',
+                      facecolor='wheat',
+                      alpha=0.8,
+                      edgecolor='black',
+                      linewidth=1)
 
-        data['smoothed_channels'] = np.array([float(x) for x in x_text.split()])
-        data['smoothed_counts'] = np.array([float(y) for y in y_text.split()])
-
-        print(f"✓ Smoothed data: {len(data['smoothed_channels'])} channels")
-
-    else:
-        data['smoothed_channels'] = None
-        data['smoothed_counts'] = None
-    
-    return data
+# Map shape names to matplotlib markers
+MARKER_SHAPES = {
+    'circle': 'o',
+    'square': 's',
+    'triangle': '^'
+}
 
 
 def get_marker_style(shape, fill):
 
-    # Map shape names to matplotlib markers
-    shape_map = {
-        'circle': 'o',
-        'square': 's',
-        'triangle': '^'
-    }
-    
-    marker = shape_map.get(shape.lower(), 'o')
+    # Shape and fill names are already lowercase (see the configuration)
+    marker = MARKER_SHAPES.get(shape, 'o')
     
     # Determine fill style
-    if fill.lower() == 'hollow':
+    if fill == 'hollow':
         fillstyle = 'none'
     else:
         fillstyle = 'full'
@@ -213,22 +279,33 @@ def get_marker_style(shape, fill):
 
 def apply_marker_range(channels, counts, range_enabled, range_min, range_max):
 
-    if not range_enabled:
-        return channels, counts
-    
-    # Find indices within range
-    mask = (channels >= range_min) & (channels <= range_max)
-    #mask = range_min <= channels <= range_max
+    if range_enabled:
+        # Channels are in ascending order: the range is one contiguous slice,
+        # found by binary search (views, no mask or copies)
+        lo = np.searchsorted(channels, range_min, side='left')
+        hi = np.searchsorted(channels, range_max, side='right')
+        
+        if hi <= lo:
+            return None, None
+        
+        channels, counts = channels[lo:hi], counts[lo:hi]
     
-    if not np.any(mask):
-        return None, None
+    # Thin out dense marker sets to at most MAX_MARKERS evenly spaced points
+    # (strided views; the lines are still drawn from the full data)
+    if MAX_MARKERS is not None and len(channels) > MAX_MARKERS:
+        stride = -(-len(channels) // MAX_MARKERS)  # rounded up
+        channels, counts = channels[::stride], counts[::stride]
     
-    return channels[mask], counts[mask]
+    return channels, counts
 
 
 def plot_spectrum(data):
     
     # ========== Setup Figure ==========
+    # pyplot (GUI backend, font setup) is only loaded once something is plotted,
+    # so importing this file just to parse spectra stays fast
+    import matplotlib.pyplot as plt
+    
     fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
 
     fig.patch.set_facecolor(BACKGROUND_COLOR)
@@ -248,22 +325,15 @@ def plot_spectrum(data):
         # Get marker style
         marker, fillstyle = get_marker_style(RAW_MARKER_SHAPE, RAW_MARKER_FILL)
         
-        # Determine line style
-        if SHOW_RAW_LINE:
-            linestyle = '-'
-            linewidth = RAW_LINE_WIDTH
-        else:
-            linestyle = ''  # No line
-            linewidth = 0
-        
-        # Plot the line
+        # Plot the line (only built at all when it is shown)
         if SHOW_RAW_LINE:
             ax.plot(raw_channels, raw_counts,
-                   linestyle=linestyle,
-                   linewidth=linewidth,
+                   linestyle='-',
+                   linewidth=RAW_LINE_WIDTH,
                    color=RAW_LINE_COLOR,
                    alpha=RAW_LINE_ALPHA,
                    label='Raw data',
+                   rasterized=RASTERIZE_LINES,
                    zorder=1)
         
         # Plot markers 
@@ -276,32 +346,25 @@ def plot_spectrum(data):
             )
             
             if marker_channels is not None:
-                # Handle hollow markers
-                if RAW_MARKER_FILL.lower() == 'hollow':
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
-                           marker=marker,
-                           markersize=RAW_MARKER_SIZE,
-                           markerfacecolor='none',
-                           markeredgecolor=RAW_MARKER_COLOR,
-                           markeredgewidth=RAW_MARKER_EDGE_WIDTH,
-                           alpha=RAW_LINE_ALPHA,
-                           label='Raw data' if not SHOW_RAW_LINE else '',
-                           zorder=3)
-                else:
-                    # Filled markers
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
-                           marker=marker,
-                           markersize=RAW_MARKER_SIZE,
-                           markerfacecolor=RAW_MARKER_COLOR,
-                           markeredgecolor=RAW_MARKER_COLOR,
-                           alpha=RAW_LINE_ALPHA,
-                           label='Raw data' if not SHOW_RAW_LINE else '',
-                           zorder=3)
+                # One plot call for both fill styles: hollow markers have no
+                # face colour and their own edge width
+                marker_kwargs = dict(linestyle='',
+                                    marker=marker,
+                                    markersize=RAW_MARKER_SIZE,
+                                    markerfacecolor=RAW_MARKER_COLOR,
+                                    markeredgecolor=RAW_MARKER_COLOR,
+                                    alpha=RAW_LINE_ALPHA,
+                                    label='Raw data' if not SHOW_RAW_LINE else '',
+                                    zorder=3)
+                if RAW_MARKER_FILL == 'hollow':
+                    marker_kwargs['markerfacecolor'] = 'none'
+                    marker_kwargs['markeredgewidth'] = RAW_MARKER_EDGE_WIDTH
                 
-                range_info = f" (channels {RAW_MARKER_RANGE_MIN}-{RAW_MARKER_RANGE_MAX})" if RAW_MARKER_RANGE_ENABLED else ""
-                print(f"✓ Plotted raw data markers: {RAW_MARKER_SHAPE}, {RAW_MARKER_FILL}{range_info}")
+                ax.plot(marker_channels, marker_counts, **marker_kwargs)
+                
+                if VERBOSE:
+                    range_info = f" (channels {RAW_MARKER_RANGE_MIN}-{RAW_MARKER_RANGE_MAX})" if RAW_MARKER_RANGE_ENABLED else ""
+                    print(f"✓ Plotted raw data markers: {RAW_MARKER_SHAPE}, {RAW_MARKER_FILL}{range_info}")
             else:
                 print(f"⚠️  No raw data points in marker range {RAW_MARKER_RANGE_MIN}-{RAW_MARKER_RANGE_MAX}")
     
@@ -317,8 +380,10 @@ def plot_spectrum(data):
                linewidth=SMOOTHED_LINE_WIDTH,
                alpha=SMOOTHED_LINE_ALPHA,
                label='Smoothed data',
+               rasterized=RASTERIZE_LINES,
                zorder=1)
-        print("✓ Plotted smoothed data line")
+        if VERBOSE:
+            print("✓ Plotted smoothed data line")
         
         # Plot markers (possibly with range restriction)
         if SHOW_SMOOTHED_MARKERS:
@@ -330,30 +395,24 @@ def plot_spectrum(data):
             )
             
             if marker_channels is not None:
-                # Handle hollow markers
-                if SMOOTHED_MARKER_FILL.lower() == 'hollow':
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
-                           marker=marker,
-                           markersize=SMOOTHED_MARKER_SIZE,
-                           markerfacecolor='none',
-                           markeredgecolor=SMOOTHED_MARKER_COLOR,
-                           markeredgewidth=SMOOTHED_MARKER_EDGE_WIDTH,
-                           alpha=SMOOTHED_LINE_ALPHA,
-                           zorder=3)
-                else:
-                    # Filled markers
-                    ax.plot(marker_channels, marker_counts,
-                           linestyle='',
-                           marker=marker,
-                           markersize=SMOOTHED_MARKER_SIZE,
-                           markerfacecolor=SMOOTHED_MARKER_COLOR,
-                           markeredgecolor=SMOOTHED_MARKER_COLOR,
-                           alpha=SMOOTHED_LINE_ALPHA,
-                           zorder=3)
+                # One plot call for both fill styles: hollow markers have no
+                # face colour and their own edge width
+                marker_kwargs = dict(linestyle='',
+                                    marker=marker,
+                                    markersize=SMOOTHED_MARKER_SIZE,
+                                    markerfacecolor=SMOOTHED_MARKER_COLOR,
+                                    markeredgecolor=SMOOTHED_MARKER_COLOR,
+                                    alpha=SMOOTHED_LINE_ALPHA,
+                                    zorder=3)
+                if SMOOTHED_MARKER_FILL == 'hollow':
+                    marker_kwargs['markerfacecolor'] = 'none'
+                    marker_kwargs['markeredgewidth'] = SMOOTHED_MARKER_EDGE_WIDTH
+                
+                ax.plot(marker_channels, marker_counts, **marker_kwargs)
                 
-                range_info = f" (channels {SMOOTHED_MARKER_RANGE_MIN}-{SMOOTHED_MARKER_RANGE_MAX})" if SMOOTHED_MARKER_RANGE_ENABLED else ""
-                print(f"✓ Plotted smoothed data markers: {SMOOTHED_MARKER_SHAPE}, {SMOOTHED_MARKER_FILL}{range_info}")
+                if VERBOSE:
+                    range_info = f" (channels {SMOOTHED_MARKER_RANGE_MIN}-{SMOOTHED_MARKER_RANGE_MAX})" if SMOOTHED_MARKER_RANGE_ENABLED else ""
+                    print(f"✓ Plotted smoothed data markers: {SMOOTHED_MARKER_SHAPE}, {SMOOTHED_MARKER_FILL}{range_info}")
             else:
                 print(f"⚠️  No smoothed data points in marker range {SMOOTHED_MARKER_RANGE_MIN}-{SMOOTHED_MARKER_RANGE_MAX}")
     
@@ -364,7 +423,7 @@ def plot_spectrum(data):
     ax.tick_params(axis='both', labelsize=TICK_LABEL_SIZE)
     
     # Set X-axis limits based on mode (channel or energy)
-    if X_AXIS_MODE.lower() == 'energy':
+    if X_AXIS_MODE == 'energy':
         # Convert energy limits to channel limits
         if ENERGY_MIN is not None and ENERGY_MAX is not None:
             ch_min = (ENERGY_MIN - cal_offset) / cal_gain
@@ -407,10 +466,17 @@ def plot_spectrum(data):
         ax.set_ylim(y_min, y_max)
     
     # Top axis: Energy (dual x-axis)
-    ax_top = ax.secondary_xaxis('top', functions=(
-        lambda ch: cal_offset + cal_gain * ch,      # channel → energy
-        lambda en: (en - cal_offset) / cal_gain     # energy → channel
-    ))
+    # Twin axis with limits mapped through the (linear) calibration: ticks
+    # are placed directly in keV, no per-tick conversion callbacks per draw
+    ax_top = ax.twiny()
+    
+    def sync_energy_axis(axis):
+        ch_min, ch_max = axis.get_xlim()
+        ax_top.set_xlim(cal_offset + cal_gain * ch_min,     # channel → energy
+                        cal_offset + cal_gain * ch_max)
+    
+    sync_energy_axis(ax)
+    ax.callbacks.connect('xlim_changed', sync_energy_axis)
     ax_top.set_xlabel('Energy [keV]', fontsize=AXIS_LABEL_SIZE, fontweight='bold')
     ax_top.tick_params(axis='x', labelsize=TICK_LABEL_SIZE)
         
@@ -452,7 +518,7 @@ def plot_spectrum(data):
             info_text = '\n'.join(info_lines)
             
             # Position info box based on configuration
-            if INFO_BOX_POSITION.lower() == 'right':
+            if INFO_BOX_POSITION == 'right':
                 # On the right side, below the legend
                 x_pos = 0.99
                 y_pos = 0.85 if SHOW_LEGEND else 0.98  # Lower if legend is shown
@@ -468,17 +534,14 @@ def plot_spectrum(data):
                    fontsize=INFO_BOX_SIZE,
                    verticalalignment='top',
                    horizontalalignment=h_align,
-                   bbox=dict(boxstyle='round',
-                           facecolor='wheat',
-                           alpha=0.8,
-                           edgecolor='black',
-                           linewidth=1))
+                   bbox=INFO_BOX_STYLE)
     
     # ========== Finalize ==========
     plt.tight_layout()
     
-    print("✓ Plot created successfully!")
-    print("="*60)
+    if VERBOSE:
+        print("✓ Plot created successfully!")
+        print("="*60)
     
     plt.show()
 
@@ -12,6 +12,22 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 import traceback
 
+# Optional C-backed XML parser (tree stays in C memory); falls back to ElementTree
+try:
+    from lxml import etree as LXML_ET
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+XML_PARSE_ERRORS = (ET.ParseError, LXML_ET.XMLSyntaxError) if LXML_AVAILABLE else (ET.ParseError,)
+
+# Dense spectra: let Agg drop near-collinear vertices of the long data lines
+# and render them in chunks (the interactive backend is kept - the plot is
+# shown in a window)
+plt.rcParams['path.simplify'] = True
+plt.rcParams['path.simplify_threshold'] = 1.0
+plt.rcParams['agg.path.chunksize'] = 10000
+
 # ============================================================================
 # USER INPUTS + CONFIGURATION 
 # ============================================================================
@@ -24,6 +40,8 @@ FILE_PATH = r"C:\Users\berke\Desktop\Giuseppe\input\RBS\RBS_NT_166°_NORM_v2.xnr
 FIGURE_SIZE = (12, 6)                  # Width x Height in inches 
 DPI = 100                              # Resolution (higher = sharper)
 # Stands for Dots Per Inch (dots as in pixels)
+DECIMATE_LINES = False                 # Draw long lines from their min/max per pixel column of the view?
+# (markers keep every point; zooming in the window will not reveal more line detail)
 
 SHOW_LEGEND = True                     # True or False
 SHOW_INFO_BOX = True                   # True or False
@@ -121,6 +139,10 @@ ENERGY_MAX = None                       # set maximum energy [keV] displayed
 COUNTS_MIN = None                      # set minimum counts 
 COUNTS_MAX = None                      # set maxixum counts 
 
+# Marker range modes resolved once here, so the plotting code tests a flag
+RAW_MARKER_RANGE_IN_ENERGY = RAW_MARKER_RANGE_MODE.lower() == 'energy'
+SMOOTHED_MARKER_RANGE_IN_ENERGY = SMOOTHED_MARKER_RANGE_MODE.lower() == 'energy'
+
 # ============================================================================
 # FUNCTIONS
 # ============================================================================
@@ -129,42 +151,112 @@ def parse_xnra_file(filepath):
 
     print(f"📂 Reading file: {filepath}")
     
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    
-    # XML namespaces
-    ns = {
-        'idf': 'http://idf.schemas.itn.pt',
-        'simnra': 'http://www.simnra.com/simnra'
+    # Clark-notation tags as produced by iterparse
+    IDF = '{http://idf.schemas.itn.pt}'
+    SIMNRA = '{http://www.simnra.com/simnra}'
+    
+    data = {
+        'filename': None,
+        'beam_particle': None,
+        'beam_energy': None,
+        'scattering_angle': None,
+        'detector_type': None,
+        'resolution': None,
+        'raw_channels': None,
+        'raw_counts': None,
+        'smoothed_channels': None,
+        'smoothed_counts': None,
     }
     
-    data = {}
-    
-    # ========== Extract Metadata ==========
-    filename_node = root.find('.//idf:filename', ns)
-    data['filename'] = filename_node.text if filename_node is not None else "XNRA Spectrum"
-    
-    beam_particle_node = root.find('.//idf:beamparticle', ns)
-    data['beam_particle'] = beam_particle_node.text if beam_particle_node is not None else None
-    
-    beam_energy_node = root.find('.//idf:beamenergy', ns)
-    data['beam_energy'] = float(beam_energy_node.text) if beam_energy_node is not None else None
-    
-    scattering_angle_node = root.find('.//idf:scatteringangle', ns)
-    data['scattering_angle'] = float(scattering_angle_node.text) if scattering_angle_node is not None else None
-    
-    detector_node = root.find('.//idf:detectortype', ns)
-    data['detector_type'] = detector_node.text if detector_node is not None else None
-    
-    resolution_node = root.find('.//idf:detectorresolution[1]/idf:resolutionparameters/idf:resolutionparameter', ns)
-    data['resolution'] = float(resolution_node.text) if resolution_node is not None else None
-    
-    # ========== Extract Calibration ==========
-    cal_params = root.findall('.//idf:energycalibration[1]/idf:calibrationparameters/idf:calibrationparameter', ns)
-    
+    # Single-value fields (key, is_number): first occurrence in the document wins
+    text_fields = {
+        IDF + 'filename': ('filename', False),
+        IDF + 'beamparticle': ('beam_particle', False),
+        IDF + 'beamenergy': ('beam_energy', True),
+        IDF + 'scatteringangle': ('scattering_angle', True),
+        IDF + 'detectortype': ('detector_type', False),
+    }
+    calibration_path = [IDF + 'energycalibration', IDF + 'calibrationparameters']
+    resolution_path = [IDF + 'detectorresolution', IDF + 'resolutionparameters']
+    
+    # Stream the XML instead of building the whole tree: each <simpledata>
+    # block (the long channel strings) is freed as soon as it has been read.
+    # The stack of open tags tells where in the document each element sits
+    if LXML_AVAILABLE:
+        events = LXML_ET.iterparse(str(filepath), events=('start', 'end'),
+                                   huge_tree=True, collect_ids=False)
+    else:
+        events = ET.iterparse(filepath, events=('start', 'end'))
+    
+    stack = []
+    cal_params = []
+    cal_done = False
+    for event, elem in events:
+        if event == 'start':
+            stack.append(elem.tag)
+            continue
+        
+        stack.pop()
+        tag = elem.tag
+        parent = stack[-1] if stack else None
+        
+        # ========== Extract Metadata ==========
+        if tag in text_fields:
+            key, is_number = text_fields[tag]
+            if data[key] is None:
+                data[key] = float(elem.text) if is_number else elem.text
+        
+        elif tag == IDF + 'resolutionparameter':
+            if data['resolution'] is None and stack[-2:] == resolution_path:
+                data['resolution'] = float(elem.text)
+        
+        # ========== Extract Calibration (first energy calibration) ==========
+        elif tag == IDF + 'calibrationparameter':
+            if not cal_done and stack[-2:] == calibration_path:
+                cal_params.append(float(elem.text))
+        elif tag == IDF + 'energycalibration':
+            cal_done = cal_done or len(cal_params) > 0
+        
+        # ========== Extract Raw / Smoothed Data ==========
+        elif tag == IDF + 'simpledata':
+            if parent == IDF + 'data' and data['raw_channels'] is None:
+                x_text = elem.find(IDF + 'x').text
+                y_text = elem.find(IDF + 'y').text
+
+                # Parsed straight into arrays in C (no Python list of floats);
+                # float32 for channel numbers (integers, exact up to 2**24); counts stay
+                # float64 because smoothed and normalized counts are fractional
+                data['raw_channels'] = np.fromstring(x_text, sep=' ', dtype=np.float32)
+                data['raw_counts'] = np.fromstring(y_text, sep=' ')
+
+                print(f"✓ Raw data: {len(data['raw_channels'])} channels")
+
+            elif parent == SIMNRA + 'smootheddata' and data['smoothed_channels'] is None:
+                x_text = elem.find(IDF + 'x').text
+                y_text = elem.find(IDF + 'y').text
+
+                # Parsed straight into arrays in C (no Python list of floats);
+                # float32 for channel numbers (integers, exact up to 2**24); counts stay
+                # float64 because smoothed and normalized counts are fractional
+                data['smoothed_channels'] = np.fromstring(x_text, sep=' ', dtype=np.float32)
+                data['smoothed_counts'] = np.fromstring(y_text, sep=' ')
+
+                print(f"✓ Smoothed data: {len(data['smoothed_channels'])} channels")
+
+            elem.clear()
+            # lxml keeps every finished element attached to the tree built so
+            # far: drop the blocks already read before this one as well
+            if LXML_AVAILABLE:
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+    
+    if data['filename'] is None:
+        data['filename'] = "XNRA Spectrum"
+    
+    # ========== Calibration ==========
     if len(cal_params) >= 2:
-        data['cal_offset'] = float(cal_params[0].text)
-        data['cal_gain'] = float(cal_params[1].text)
+        data['cal_offset'] = cal_params[0]
+        data['cal_gain'] = cal_params[1]
         print("Calibration parameters found !")
 
     else:
@@ -172,40 +264,6 @@ def parse_xnra_file(filepath):
         data['cal_gain'] = 1
         print("⚠️  No calibration found, using default (E = Ch)")
     
-    # ========== Extract Raw Data ==========
-    raw_data = root.find('.//idf:data/idf:simpledata', ns)
-
-    if raw_data is not None:
-
-        x_text = raw_data.find('idf:x', ns).text
-        y_text = raw_data.find('idf:y', ns).text
-
-        data['raw_channels'] = np.array([float(x) for x in x_text.split()])
-        data['raw_counts'] = np.array([float(y) for y in y_text.split()])
-
-        print(f"✓ Raw data: {len(data['raw_channels'])} channels")
-
-    else:
-        data['raw_channels'] = None
-        data['raw_counts'] = None
-    
-    # ========== Extract Smoothed Data ==========
-    smoothed_data = root.find('.//simnra:smootheddata/idf:simpledata', ns)
-
-    if smoothed_data is not None:
-
-        x_text = smoothed_data.find('idf:x', ns).text
-        y_text = smoothed_data.find('idf:y', ns).text
-
-        data['smoothed_channels'] = np.array([float(x) for x in x_text.split()])
-        data['smoothed_counts'] = np.array([float(y) for y in y_text.split()])
-
-        print(f"✓ Smoothed data: {len(data['smoothed_channels'])} channels")
-
-    else:
-        data['smoothed_channels'] = None
-        data['smoothed_counts'] = None
-    
     return data
 
 
@@ -229,28 +287,56 @@ def get_marker_style(shape, fill):
     return marker, fillstyle
 
 
-def apply_marker_range(channels, counts, range_enabled, range_mode, range_min, range_max, cal_offset, cal_gain):
+def apply_marker_range(channels, counts, range_enabled, range_in_energy, range_min, range_max, cal_offset, inv_gain):
     
     if not range_enabled:
         return channels, counts
     
     # Convert energy range to channel range if needed
-    if range_mode.lower() == 'energy':
+    if range_in_energy:
         # Energy → Channel conversion: Ch = (E - offset) / gain
-        ch_min = (range_min - cal_offset) / cal_gain
-        ch_max = (range_max - cal_offset) / cal_gain
+        ch_min = (range_min - cal_offset) * inv_gain
+        ch_max = (range_max - cal_offset) * inv_gain
     else:  # channel mode
         ch_min = range_min
         ch_max = range_max
     
-    # Find indices within range (inclusive)
-    mask = (channels >= ch_min) & (channels <= ch_max)
+    # Channels are in ascending order: the range (inclusive) is one contiguous
+    # slice, found by binary search (views, no mask or copies)
+    lo = np.searchsorted(channels, ch_min, side='left')
+    hi = np.searchsorted(channels, ch_max, side='right')
     
     # Check if any points are in range
-    if not np.any(mask):
+    if hi <= lo:
         return None, None
     
-    return channels[mask], counts[mask]
+    return channels[lo:hi], counts[lo:hi]
+
+
+def decimate_line(channels, counts, max_points, view_min=None, view_max=None):
+    
+    # The budget is for the points inside the configured x-limits (None = data
+    # edge): the whole line is kept at that density, so zoomed-in views stay sharp
+    lo = 0 if view_min is None else np.searchsorted(channels, view_min, side='left')
+    hi = len(channels) if view_max is None else np.searchsorted(channels, view_max, side='right')
+    n_visible = hi - lo
+    if n_visible <= max_points:
+        return channels, counts
+    max_points = max_points * len(channels) // n_visible
+    
+    # Split the points into max_points/2 buckets of consecutive channels and keep
+    # the lowest and highest count of each, in order: peaks and dips survive
+    size = -(-len(channels) // (max_points // 2))  # points per bucket, rounded up
+    n_full = len(channels) // size * size
+    buckets = counts[:n_full].reshape(-1, size)
+    starts = np.arange(0, n_full, size)
+    
+    # Leftover points (fewer than one bucket) are kept as they are
+    keep = np.unique(np.concatenate((starts + buckets.argmin(axis=1),
+                                     starts + buckets.argmax(axis=1),
+                                     np.arange(n_full, len(channels)))))
+    
+    return channels[keep], counts[keep]
 
 
 def plot_spectrum(data):
@@ -269,6 +355,17 @@ def plot_spectrum(data):
     
     cal_offset = data['cal_offset']
     cal_gain = data['cal_gain']
+    inv_gain = 1.0 / cal_gain  # reused by every energy → channel conversion
+    
+    # Points beyond ~2 per pixel column only overdraw the same pixels
+    max_line_points = int(FIGURE_SIZE[0] * DPI * 2)
+    
+    # Configured x-limits in channels, so the line budget follows the view
+    if X_AXIS_MODE.lower() == 'energy':
+        view_min = (ENERGY_MIN - cal_offset) * inv_gain if ENERGY_MIN is not None else None
+        view_max = (ENERGY_MAX - cal_offset) * inv_gain if ENERGY_MAX is not None else None
+    else:
+        view_min, view_max = CHANNEL_MIN, CHANNEL_MAX
     
     # ========== Plot Raw Data ==========
     if SHOW_RAW_DATA and raw_channels is not None and raw_counts is not None:
@@ -280,7 +377,12 @@ def plot_spectrum(data):
             linestyle = '-'
             linewidth = RAW_LINE_WIDTH
 
-            ax.plot(raw_channels, raw_counts,
+            line_channels, line_counts = raw_channels, raw_counts
+            if DECIMATE_LINES:
+                line_channels, line_counts = decimate_line(raw_channels, raw_counts, max_line_points,
+                                                           view_min, view_max)
+
+            ax.plot(line_channels, line_counts,
                    linestyle=linestyle,
                    linewidth=linewidth,
                    color=RAW_LINE_COLOR,
@@ -295,11 +397,11 @@ def plot_spectrum(data):
             marker_channels, marker_counts = apply_marker_range(
                 raw_channels, raw_counts,
                 RAW_MARKER_RANGE_ENABLED,
-                RAW_MARKER_RANGE_MODE,
+                RAW_MARKER_RANGE_IN_ENERGY,
                 RAW_MARKER_RANGE_MIN,
                 RAW_MARKER_RANGE_MAX,
                 cal_offset,
-                cal_gain
+                inv_gain
             )
             
             # Check if we have valid marker data
@@ -330,7 +432,7 @@ def plot_spectrum(data):
                 
                 # Print status with appropriate units
                 if RAW_MARKER_RANGE_ENABLED:
-                    unit = 'keV' if RAW_MARKER_RANGE_MODE.lower() == 'energy' else 'channels'
+                    unit = 'keV' if RAW_MARKER_RANGE_IN_ENERGY else 'channels'
                     range_info = f" ({RAW_MARKER_RANGE_MIN}-{RAW_MARKER_RANGE_MAX} {unit})"
                 else:
                     range_info = ""
@@ -338,7 +440,7 @@ def plot_spectrum(data):
                 print(f"✓ Plotted raw data markers: {RAW_MARKER_SHAPE}, {RAW_MARKER_FILL}{range_info}")
             else:
                 # No markers in range - print warning
-                unit = 'keV' if RAW_MARKER_RANGE_MODE.lower() == 'energy' else 'channels'
+                unit = 'keV' if RAW_MARKER_RANGE_IN_ENERGY else 'channels'
                 print(f"⚠️  No raw data points in marker range {RAW_MARKER_RANGE_MIN}-{RAW_MARKER_RANGE_MAX} {unit}")
                 
     # ========== Plot Smoothed Data ==========
@@ -351,8 +453,13 @@ def plot_spectrum(data):
             linestyle = '-'
             linewidth = SMOOTHED_LINE_WIDTH
 
-            # Plot the line (full data)
-            ax.plot(smoothed_channels, smoothed_counts, 
+            # Plot the line (full data, decimated to the pixel resolution)
+            line_channels, line_counts = smoothed_channels, smoothed_counts
+            if DECIMATE_LINES:
+                line_channels, line_counts = decimate_line(smoothed_channels, smoothed_counts, max_line_points,
+                                                           view_min, view_max)
+
+            ax.plot(line_channels, line_counts, 
                     linestyle=linestyle,
                     linewidth=linewidth,
                     color=SMOOTHED_LINE_COLOR,
@@ -367,11 +474,11 @@ def plot_spectrum(data):
             marker_channels, marker_counts = apply_marker_range(
                 smoothed_channels, smoothed_counts,
                 SMOOTHED_MARKER_RANGE_ENABLED,
-                SMOOTHED_MARKER_RANGE_MODE,
+                SMOOTHED_MARKER_RANGE_IN_ENERGY,
                 SMOOTHED_MARKER_RANGE_MIN,
                 SMOOTHED_MARKER_RANGE_MAX,
                 cal_offset,
-                cal_gain
+                inv_gain
             )
             
             # Check if we have valid marker data
@@ -400,7 +507,7 @@ def plot_spectrum(data):
                 
                 # Print status with appropriate units
                 if SMOOTHED_MARKER_RANGE_ENABLED:
-                    unit = 'keV' if SMOOTHED_MARKER_RANGE_MODE.lower() == 'energy' else 'channels'
+                    unit = 'keV' if SMOOTHED_MARKER_RANGE_IN_ENERGY else 'channels'
                     range_info = f" ({SMOOTHED_MARKER_RANGE_MIN}-{SMOOTHED_MARKER_RANGE_MAX} {unit})"
                 else:
                     range_info = ""
@@ -408,7 +515,7 @@ def plot_spectrum(data):
                 print(f"✓ Plotted smoothed data markers: {SMOOTHED_MARKER_SHAPE}, {SMOOTHED_MARKER_FILL}{range_info}")
             else:
                 # No markers in range - print warning
-                unit = 'keV' if SMOOTHED_MARKER_RANGE_MODE.lower() == 'energy' else 'channels'
+                unit = 'keV' if SMOOTHED_MARKER_RANGE_IN_ENERGY else 'channels'
                 print(f"⚠️  No smoothed data points in marker range {SMOOTHED_MARKER_RANGE_MIN}-{SMOOTHED_MARKER_RANGE_MAX} {unit}")
 
     # ========== Setup Axes ==========
@@ -427,16 +534,16 @@ def plot_spectrum(data):
     if X_AXIS_MODE.lower() == 'energy':
         # Convert energy limits to channel limits
         if ENERGY_MIN is not None and ENERGY_MAX is not None:
-            ch_min = (ENERGY_MIN - cal_offset) / cal_gain
-            ch_max = (ENERGY_MAX - cal_offset) / cal_gain
+            ch_min = (ENERGY_MIN - cal_offset) * inv_gain
+            ch_max = (ENERGY_MAX - cal_offset) * inv_gain
             ax.set_xlim(ch_min, ch_max)
 
         elif ENERGY_MIN is not None:
-            ch_min = (ENERGY_MIN - cal_offset) / cal_gain
+            ch_min = (ENERGY_MIN - cal_offset) * inv_gain
             ax.set_xlim(left=ch_min)
 
         elif ENERGY_MAX is not None:
-            ch_max = (ENERGY_MAX - cal_offset) / cal_gain
+            ch_max = (ENERGY_MAX - cal_offset) * inv_gain
             ax.set_xlim(right=ch_max)
 
         else:
@@ -467,9 +574,11 @@ def plot_spectrum(data):
         ax.set_ylim(y_min, y_max)
     
     # Top axis: Energy (dual x-axis)
+    # Ticks are recomputed on every pan/zoom, so both conversions stay single
+    # NumPy ufunc calls on the whole tick array
     ax_top = ax.secondary_xaxis('top', functions=(
-        lambda ch: cal_offset + cal_gain * ch,      # channel → energy
-        lambda en: (en - cal_offset) / cal_gain     # energy → channel
+        lambda ch: np.add(cal_offset, np.multiply(cal_gain, ch, dtype=np.float64)),       # channel → energy
+        lambda en: np.multiply(np.subtract(en, cal_offset, dtype=np.float64), inv_gain)   # energy → channel
     ))
     ax_top.set_xlabel('Energy [keV]', fontsize=AXIS_LABEL_SIZE, fontweight='bold', color=AXIS_LABEL_COLOR)
     ax_top.tick_params(axis='x', 
@@ -576,7 +685,7 @@ def main():
         # Create plot
         plot_spectrum(data)
         
-    except ET.ParseError as e:
+    except XML_PARSE_ERRORS as e:
         print(f"\n  ERROR: Invalid XML file!")
         print(f"   {e}")
     except Exception as e:
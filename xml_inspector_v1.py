@@ -1,35 +1,88 @@
 import xml.etree.ElementTree as ET
 
+# Optional C-backed XML parser with compiled XPath; falls back to ElementTree
+try:
+    from lxml import etree as LXML_ET
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
 file_path = r"C:\Users\berke\Desktop\Giuseppe\urgent_check\H392-15 550 °C NA 10 mg 166°.xnra"
 
 IDF = "http://idf.schemas.itn.pt"
 SIM = "http://www.simnra.com/simnra"
 ns = {"idf": IDF, "simnra": SIM}
 
-tree = ET.parse(file_path)
+def compile_path(path):
+    # Returns a finder for the first match below a node. lxml compiles the
+    # XPath once; ElementTree's find() already caches its compiled paths
+    if LXML_AVAILABLE:
+        xpath = LXML_ET.XPath(path, namespaces=ns)
+        return lambda node: next(iter(xpath(node)), None)
+    return lambda node: node.find(path, ns)
+
+find_calculated = compile_path(".//simnra:calculateddata/idf:simpledata")
+find_simulated = compile_path(".//simnra:simulateddata/idf:simpledata")
+find_calc_spectrum = compile_path('.//simnra:spectrum[@type="calculated"]')
+find_simpledata = compile_path(".//idf:simpledata")
+find_x = compile_path("idf:x")
+find_y = compile_path("idf:y")
+
+if LXML_AVAILABLE:
+    # Comments/PIs dropped so every node has a string tag (as with ElementTree)
+    parser = LXML_ET.XMLParser(huge_tree=True, remove_comments=True, remove_pis=True)
+    tree = LXML_ET.parse(file_path, parser=parser)
+else:
+    tree = ET.parse(file_path)
 root = tree.getroot()
 
-# Build parent pointers (read-only)
-parent = {c: p for p in root.iter() for c in p}
+# Parent pointers (read-only): lxml elements know their parent; ElementTree
+# needs a child -> parent map, built only once a path is actually printed
+parent = None
+
+def get_parent(elem):
+    global parent
+    if LXML_AVAILABLE:
+        return elem.getparent()
+    if parent is None:
+        parent = {c: p for p in root.iter() for c in p}
+    return parent.get(elem)
 
 def local(tag: str) -> str:
     # "{ns}name" -> "name"
     return tag.split("}", 1)[-1] if "}" in tag else tag
 
+# Parent -> {child: 1-based index among its same-tag siblings}; children with
+# a unique tag are left out. Filled once per parent, in a single pass
+sibling_index = {}
+
+def same_tag_index(p, elem):
+    indices = sibling_index.get(p)
+    if indices is None:
+        counts = {}
+        for c in p:
+            counts[c.tag] = counts.get(c.tag, 0) + 1
+        seen = {}
+        indices = sibling_index[p] = {}
+        for c in p:
+            if counts[c.tag] > 1:
+                seen[c.tag] = seen.get(c.tag, 0) + 1
+                indices[c] = seen[c.tag]
+    return indices.get(elem)
+
 def xpath_of(elem) -> str:
     # Build an absolute-ish path with tag names and sibling indices
     parts = []
     cur = elem
     while cur is not None:
-        p = parent.get(cur)
+        p = get_parent(cur)
         if p is None:
             parts.append(local(cur.tag))
             break
 
         # index among same-tag siblings for disambiguation
-        same = [c for c in list(p) if c.tag == cur.tag]
-        if len(same) > 1:
-            idx = same.index(cur) + 1  # 1-based
+        idx = same_tag_index(p, cur)
+        if idx is not None:
             parts.append(f"{local(cur.tag)}[{idx}]")
         else:
             parts.append(local(cur.tag))
@@ -44,20 +97,20 @@ candidates = []
 # Path 1
 candidates.append((
     "path 1: .//simnra:calculateddata/idf:simpledata",
-    root.find(".//simnra:calculateddata/idf:simpledata", ns)
+    find_calculated(root)
 ))
 
 # Path 2
 candidates.append((
     "path 2: .//simnra:simulateddata/idf:simpledata",
-    root.find(".//simnra:simulateddata/idf:simpledata", ns)
+    find_simulated(root)
 ))
 
 # Path 3
-calc_spectrum = root.find('.//simnra:spectrum[@type="calculated"]', ns)
+calc_spectrum = find_calc_spectrum(root)
 sd3 = None
 if calc_spectrum is not None:
-    sd3 = calc_spectrum.find(".//idf:simpledata", ns)
+    sd3 = find_simpledata(calc_spectrum)
 candidates.append((
     'path 3: .//simnra:spectrum[@type="calculated"]//idf:simpledata',
     sd3
@@ -66,10 +119,14 @@ candidates.append((
 # Path 4 (heuristic)
 sd4 = None
 hit_parent = None
+is_hint = {}  # tag -> contains "calc"/"simul"; tested once per distinct tag
 for elem in root.iter():
-    t = elem.tag.lower()
-    if "calc" in t or "simul" in t:
-        simdata = elem.find(".//idf:simpledata", ns)
+    hint = is_hint.get(elem.tag)
+    if hint is None:
+        t = elem.tag.lower()
+        hint = is_hint[elem.tag] = "calc" in t or "simul" in t
+    if hint:
+        simdata = find_simpledata(elem)
         if simdata is not None:
             sd4 = simdata
             hit_parent = elem
@@ -95,8 +152,8 @@ else:
     print("simpledata path:", xpath_of(chosen))
 
     # Helpful: show where x/y live too
-    x = chosen.find("idf:x", ns)
-    y = chosen.find("idf:y", ns)
+    x = find_x(chosen)
+    y = find_y(chosen)
     if x is not None:
         print("x path:", xpath_of(x))
     if y is not None: